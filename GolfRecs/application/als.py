@@ -5,22 +5,819 @@ The alternating least squares with regularization algorithm ALS-WR was first
 demonstrated in the paper Large-scale Parallel Collaborative Filtering for
 the Netflix Prize. The authors discuss the method as well as how they
 parallelized the algorithm in Matlab. This module implements the algorithm in
-parallel in python with the built in concurrent.futures module.
+parallel in python with the built in concurrent.futures module. The ratings
+and both feature matrices are placed in shared memory blocks for the duration
+of a fit so that worker processes can attach to them once and write their
+solved columns in place rather than receiving pickled copies of the model.
+
+The updates can run on one of three backends, 'serial', 'threads' or
+'processes', whose pool lives for the whole fit. When threadpoolctl is
+installed the number of BLAS threads used by each worker is limited as well,
+so that the workers and BLAS do not oversubscribe the machine.
+
+ImplicitALS fits implicit feedback, such as page views, with the confidence
+weighted loss of Hu, Koren and Volinsky on the same machinery, and
+MultiCriteriaALS fits the overall rating and every sub-rating of the reviews
+together.
 """
 
-from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
-                                as_completed)
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
 from itertools import repeat
-from os import cpu_count
+from multiprocessing import shared_memory
+from os import cpu_count, path, remove, replace
+from time import perf_counter
+from warnings import warn
 
 import numpy as np
 from numpy.linalg import LinAlgError
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, issparse, isspmatrix_csr
 from sklearn.metrics import mean_squared_error
 
+from geo import GeoTiles
+from mips import MIPSIndex
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
 # pylint: disable=E1101
 np.seterr(divide='ignore', invalid='ignore')
 POOL_SIZE = cpu_count()
+MAX_BLOCK_BYTES = 2 ** 28
+PREDICT_CHUNK = 2 ** 16
+PENDING_THRESHOLD = 10000
+BIAS_LAMBDA = 10.0
+USER_CACHE_SIZE = 10000
+REFINE_STEPS = 8
+REFINE_TOL = 1e-10
+BACKENDS = ('serial', 'threads', 'processes')
+ORDERINGS = ('natural', 'degree')
+SOLVERS = ('direct', 'cg')
+_SHARED = {}
+
+
+class SharedArrays(object):
+    """Collection of numpy arrays backed by shared memory blocks.
+
+    Each array is copied once into its own block. Worker processes attach to
+    the blocks by name with attach_shared and see the same memory, so writes
+    made by a worker are visible to the parent without any pickling.
+
+    Attributes:
+        arrays (dict): Dictionary of array name to the shared ndarray view.
+        specs (dict): Dictionary of array name to a tuple of block name,
+            shape and dtype string which is all a worker needs to attach.
+
+    """
+
+    def __init__(self, arrays):
+        """Copy the given arrays into newly created shared memory blocks.
+
+        Args:
+            arrays (dict): Dictionary of array name to np.ndarray.
+
+        """
+        self.arrays = {}
+        self.specs = {}
+        self._blocks = []
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(
+                create=True,
+                size=max(array.nbytes, 1)
+            )
+            self._blocks.append(block)
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            view[...] = array
+            self.arrays[name] = view
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        """Release and unlink all of the shared memory blocks."""
+        self.arrays = {}
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        """Return self for use as a context manager."""
+        return self
+
+    def __exit__(self, *args):
+        """Release the shared memory blocks."""
+        self.close()
+
+
+class GrowableArray(object):
+    """Buffer whose last axis grows with amortized constant time appends.
+
+    The buffer doubles its capacity whenever it runs out, so growing it one
+    column at a time N times copies O(N) values in total instead of O(N^2).
+
+    Attributes:
+        size (int): The logical length of the last axis.
+        view (np.ndarray): View of the buffer holding the first size entries
+            of the last axis.
+
+    """
+
+    def __init__(self, array, capacity=None):
+        """Copy an array into a new buffer.
+
+        Args:
+            array (np.ndarray): The initial contents.
+            capacity (int, default=None): The initial capacity of the last
+                axis, at least the length of array's last axis.
+
+        """
+        array = np.asarray(array)
+        self.size = array.shape[-1]
+        capacity = max(capacity or 0, self.size)
+        self._buf = np.zeros(array.shape[:-1] + (capacity,), dtype=array.dtype)
+        self._buf[..., :self.size] = array
+        self.view = self._buf[..., :self.size]
+
+    @property
+    def capacity(self):
+        """Return the allocated length of the last axis."""
+        return self._buf.shape[-1]
+
+    def grow(self, size, fill=0):
+        """Grow the logical length of the last axis.
+
+        Args:
+            size (int): The new length. Nothing changes if it is not larger
+                than the current size.
+            fill (scalar, default=0): The value of the new entries.
+        Returns:
+            view (np.ndarray): The view of the grown array.
+
+        """
+        if size <= self.size:
+            return self.view
+        if size > self.capacity:
+            buf = np.zeros(
+                self._buf.shape[:-1] + (max(size, 2 * self.capacity),),
+                dtype=self._buf.dtype
+            )
+            buf[..., :self.size] = self.view
+            self._buf = buf
+        self._buf[..., self.size:size] = fill
+        self.size = size
+        self.view = self._buf[..., :size]
+        return self.view
+
+
+def compact_values(values):
+    """Return values in the smallest integer type that holds them exactly.
+
+    Star ratings and interaction counts are whole numbers, so storing them as
+    uint8 rather than float64 cuts the memory and bandwidth of the ratings
+    eightfold. They are upcast to floats only where a solve uses them.
+
+    Args:
+        values (np.ndarray): Array of rating values.
+    Returns:
+        values (np.ndarray): The same values, as the smallest integer type if
+            they are all whole numbers, otherwise unchanged.
+
+    """
+    values = np.asarray(values)
+    if not values.size or values.dtype.kind not in 'fiu' or \
+            not np.array_equal(values, np.round(values)):
+        return values
+    dtype = np.result_type(
+        np.min_scalar_type(int(values.min())),
+        np.min_scalar_type(int(values.max()))
+    )
+    return values.astype(dtype)
+
+
+class RatingsData(object):
+    """Immutable dual format view of a ratings matrix.
+
+    The ratings do not change over the course of a fit, so every structure
+    the updates and the error evaluation need is derived from them once. All
+    arrays are marked read only. The values are stored with compact_values
+    and the coordinates share the index type of the CSR matrix, int32 unless
+    the ratings are too large for it.
+
+    Attributes:
+        shape (tuple): The shape of the ratings matrix, users x items.
+        csr (scipy.sparse.csr_matrix): Ratings in compressed row format.
+        csc (scipy.sparse.csc_matrix): Ratings in compressed column format.
+        rows (np.ndarray): The user of every rating, aligned with csr.data.
+        cols (np.ndarray): The item of every rating, aligned with csr.data.
+        row_counts (np.ndarray): The number of ratings made by each user.
+        col_counts (np.ndarray): The number of ratings received by each item.
+
+    """
+
+    def __init__(self, ratings):
+        """Build the CSR and CSC formats and the coordinate arrays.
+
+        Args:
+            ratings (numpy.ndarray or scipy.sparse): Ratings matrix of users x
+                items.
+
+        """
+        csr = csr_matrix(ratings, copy=True)
+        csr.sum_duplicates()
+        csr.eliminate_zeros()
+        csr.data = compact_values(csr.data)
+        csc = csr.tocsc()
+        self.shape = csr.shape
+        self.csr = csr
+        self.csc = csc
+        self.row_counts = np.diff(csr.indptr)
+        self.col_counts = np.diff(csc.indptr)
+        self.rows = np.repeat(
+            np.arange(csr.shape[0], dtype=csr.indices.dtype),
+            self.row_counts
+        )
+        self.cols = csr.indices
+        for array in (csr.indptr, csr.indices, csr.data, csc.indptr,
+                      csc.indices, csc.data, self.row_counts,
+                      self.col_counts, self.rows):
+            array.flags.writeable = False
+
+    @property
+    def nnz(self):
+        """Return the number of stored ratings."""
+        return self.csr.nnz
+
+
+def attach_shared(specs):
+    """Attach the current process to the shared arrays described by specs.
+
+    Used as the initializer of worker processes so that each worker attaches
+    to the shared blocks exactly once per pool rather than once per task.
+
+    Args:
+        specs (dict): Dictionary of array name to a tuple of block name,
+            shape and dtype string as produced by SharedArrays.specs.
+
+    """
+    for _, (block, _) in _SHARED.items():
+        block.close()
+    _SHARED.clear()
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        _SHARED[name] = (block, view)
+
+
+def limit_blas_threads(blas_threads):
+    """Limit the number of threads BLAS uses in the current process.
+
+    Args:
+        blas_threads (int or None): The number of BLAS threads. Nothing is
+            changed when None.
+    Returns:
+        limits (threadpoolctl.threadpool_limits or None): Object that restores
+            the original limits when used as a context manager or None if
+            threadpoolctl is not installed or blas_threads is None.
+
+    """
+    if blas_threads is None:
+        return None
+    if threadpool_limits is None:
+        warn('threadpoolctl is not installed, BLAS threads are not limited.')
+        return None
+    return threadpool_limits(limits=blas_threads, user_api='blas')
+
+
+def init_worker(specs, blas_threads):
+    """Initialize a worker process for ALS updates.
+
+    Args:
+        specs (dict): Shared array specs as produced by SharedArrays.specs.
+        blas_threads (int or None): The number of BLAS threads per worker.
+
+    """
+    limit_blas_threads(blas_threads)
+    attach_shared(specs)
+
+
+def segment_positions(starts, counts):
+    """Return the positions covered by consecutive segments of an array.
+
+    Args:
+        starts (np.ndarray): Array with the first position of each segment.
+        counts (np.ndarray): Array with the length of each segment.
+    Returns:
+        positions (np.ndarray): The concatenated positions of all segments.
+        offsets (np.ndarray): Array with the index in positions at which each
+            segment begins.
+
+    """
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(int)
+    positions = np.arange(counts.sum()) - np.repeat(offsets - starts, counts)
+    return positions, offsets
+
+
+def solve_block(indptr, indices, data, fixed, rows, lambda_, alpha=None,
+                gramian=None, init=None, cg_steps=None):
+    """Solve the regularized normal equations for a block of rows at once.
+
+    The submatrix of fixed features for every row is gathered in a single
+    fancy index, the stacked Gram matrices and right hand sides are built with
+    segment reductions over indptr one Gram row at a time, so that no more
+    than a few nnz x rank arrays are alive at once, and all of the systems are
+    solved by one batched call to np.linalg.solve. Should that call fail
+    because a system is singular, the block falls back to solving row by row
+    where any singular row is set to zeros just as _user_state does.
+
+    With cg_steps the systems are instead solved inexactly by that many steps
+    of conjugate gradient started from init, see cg_block. No Gram matrix is
+    formed, which pays off at high ranks where the columns of the previous
+    iteration are already close.
+
+    With alpha the data are implicit feedback solved as in Hu, Koren and
+    Volinsky, Collaborative Filtering for Implicit Feedback Datasets. Every
+    row has preference one on its entries and zero elsewhere with confidence
+    1 + alpha * data, so its Gram matrix is gramian, the Gram matrix of all of
+    the fixed features computed once per half iteration, plus the entries'
+    features weighted by alpha * data. The solve only touches the entries.
+
+    Args:
+        indptr (np.ndarray): Index pointer array of the CSR (user) or CSC
+            (item) ratings.
+        indices (np.ndarray): Column (CSR) or row (CSC) indices of the ratings.
+        data (np.ndarray): Rating values aligned with indices.
+        fixed (np.ndarray): Array of shape rank x n containing the features
+            that are held fixed during the update.
+        rows (np.ndarray): Array of the rows of indptr that are to be solved.
+        lambda_ (float): The regularization parameter.
+        alpha (float, default=None): The confidence scale of implicit data,
+            None for explicit ratings.
+        gramian (np.ndarray, default=None): Array of shape rank x rank with
+            fixed.dot(fixed.T), required with alpha.
+        init (np.ndarray, default=None): Array of shape rank x rows.size with
+            the current columns that conjugate gradient starts from, zeros
+            when None.
+        cg_steps (int, default=None): The number of conjugate gradient steps,
+            None to solve exactly.
+    Returns:
+        cols (np.ndarray): Array of shape rank x rows.size with the solved
+            feature columns.
+
+    """
+    rank = fixed.shape[0]
+    rows = np.asarray(rows)
+    starts, stops = indptr[rows], indptr[rows + 1]
+    counts = stops - starts
+    cols = np.zeros((rank, rows.size))
+    rated = counts > 0
+    if not rated.any():
+        return cols
+    starts, counts = starts[rated], counts[rated]
+    positions, offsets = segment_positions(starts, counts)
+    submat = fixed[:, indices[positions]].T.astype(float, copy=False)
+    if alpha is None:
+        weighted, targets = submat, data[positions]
+        reg = lambda_ * counts[:, np.newaxis, np.newaxis] * np.eye(rank)
+    else:
+        conf = alpha * data[positions]
+        weighted, targets = submat * conf[:, np.newaxis], 1 + conf
+        reg = gramian + lambda_ * np.eye(rank)
+    if cg_steps is not None:
+        rhs = np.add.reduceat(
+            submat * targets[:, np.newaxis],
+            offsets,
+            axis=0
+        )
+        start = np.zeros_like(rhs) if init is None else init[:, rated].T
+        if alpha is None:
+            diag, dense = lambda_ * counts, None
+        else:
+            diag, dense = np.full(counts.size, lambda_), gramian
+        cols[:, rated] = cg_block(
+            submat, weighted, offsets, rhs, start, diag, dense, cg_steps
+        ).T
+        return cols
+    grams = np.empty((counts.size, rank, rank))
+    for dim in range(rank):
+        grams[:, dim] = np.add.reduceat(
+            weighted * submat[:, dim, np.newaxis],
+            offsets,
+            axis=0
+        )
+    grams += reg
+    rhs = np.add.reduceat(
+        submat * targets[:, np.newaxis],
+        offsets,
+        axis=0
+    )
+    try:
+        solved = np.linalg.solve(grams, rhs[:, :, np.newaxis])[:, :, 0]
+    except LinAlgError:
+        solved = np.zeros_like(rhs)
+        for row, (gram, vec) in enumerate(zip(grams, rhs)):
+            try:
+                solved[row] = np.linalg.solve(gram, vec)
+            except LinAlgError:
+                pass
+    cols[:, rated] = solved.T
+    return cols
+
+
+def cg_block(submat, weighted, offsets, rhs, start, diag, dense, steps):
+    """Run conjugate gradient on a block of normal equations at once.
+
+    The system of a row is (sum_j w_j y_j y_j^T + diag I + dense) x = rhs,
+    where y_j are the row's gathered fixed features and w_j their weights. It
+    is only ever applied to vectors, as one inner product per entry followed
+    by a segment sum, so each step costs O(nnz * rank) for the whole block and
+    the rank x rank matrices are never formed. The step sizes are computed
+    for every row separately, vectorized across the block.
+
+    Args:
+        submat (np.ndarray): Array of shape entries x rank of the gathered
+            fixed features, grouped by row.
+        weighted (np.ndarray): submat scaled by the weight of each entry.
+        offsets (np.ndarray): The first entry of every row.
+        rhs (np.ndarray): Array of shape rows x rank.
+        start (np.ndarray): Array of shape rows x rank to start from.
+        diag (np.ndarray): The regularization added to the diagonal of each
+            row's system.
+        dense (np.ndarray or None): A rank x rank matrix shared by every row,
+            such as the gramian of implicit feedback.
+        steps (int): The number of steps.
+    Returns:
+        solved (np.ndarray): Array of shape rows x rank.
+
+    """
+    segment = np.repeat(
+        np.arange(offsets.size), np.diff(np.append(offsets, len(submat)))
+    )
+
+    def apply(vecs):
+        dots = np.einsum('ij,ij->i', weighted, vecs[segment])
+        prod = np.add.reduceat(submat * dots[:, np.newaxis], offsets, axis=0)
+        prod += diag[:, np.newaxis] * vecs
+        if dense is not None:
+            prod += vecs.dot(dense.T)
+        return prod
+
+    solved = np.array(start, dtype=float)
+    resid = rhs - apply(solved)
+    direction = resid.copy()
+    norms = np.einsum('ij,ij->i', resid, resid)
+    for _ in range(steps):
+        prod = apply(direction)
+        curv = np.einsum('ij,ij->i', direction, prod)
+        step = np.zeros_like(norms)
+        np.divide(norms, curv, out=step, where=curv > 0)
+        solved += step[:, np.newaxis] * direction
+        resid -= step[:, np.newaxis] * prod
+        new_norms = np.einsum('ij,ij->i', resid, resid)
+        ratio = np.zeros_like(norms)
+        np.divide(new_norms, norms, out=ratio, where=norms > 0)
+        direction = resid + ratio[:, np.newaxis] * direction
+        norms = new_norms
+    return solved
+
+
+def solve_targets_block(indptr, indices, values, mask, fixed, rows,
+                        lambda_):
+    """Solve one feature column per target for a block of rows.
+
+    Every target of a row shares the fixed features of the row's entries, so
+    the Gram matrix is built once from all of the entries and the targets are
+    solved together as multiple right hand sides. When some entries lack a
+    target, the outer products of those entries are subtracted from that
+    target's copy of the Gram matrix, which only costs in proportion to the
+    missing values. A target a row has no values for is solved as zeros.
+
+    Args:
+        indptr (np.ndarray): Index pointer array of the entries of each row.
+        indices (np.ndarray): The column of the fixed features of each entry.
+        values (np.ndarray): Array of shape entries x targets.
+        mask (np.ndarray): Boolean array of shape entries x targets, True
+            where the value is present.
+        fixed (np.ndarray): Array of shape rank x columns of fixed features.
+        rows (np.ndarray): Array of the rows of indptr that are to be solved.
+        lambda_ (float): The regularization parameter.
+    Returns:
+        cols (np.ndarray): Array of shape targets x rank x rows.size.
+
+    """
+    rank, n_targets = fixed.shape[0], values.shape[1]
+    rows = np.asarray(rows)
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    cols = np.zeros((n_targets, rank, rows.size))
+    rated = counts > 0
+    if not rated.any():
+        return cols
+    starts, counts = starts[rated], counts[rated]
+    positions, offsets = segment_positions(starts, counts)
+    submat = fixed[:, indices[positions]].T.astype(float, copy=False)
+    present = mask[positions]
+    target_counts = np.add.reduceat(present, offsets, axis=0)
+    gram = np.empty((counts.size, rank, rank))
+    for dim in range(rank):
+        gram[:, dim] = np.add.reduceat(
+            submat * submat[:, dim, np.newaxis],
+            offsets,
+            axis=0
+        )
+    rhs = np.empty((counts.size, rank, n_targets))
+    for target in range(n_targets):
+        rhs[:, :, target] = np.add.reduceat(
+            submat * np.where(present[:, target], values[positions, target],
+                              0)[:, np.newaxis],
+            offsets,
+            axis=0
+        )
+    eye = np.eye(rank)
+    if present.all():
+        grams = gram + lambda_ * counts[:, np.newaxis, np.newaxis] * eye
+        try:
+            solved = np.linalg.solve(grams, rhs)
+            cols[:, :, rated] = solved.transpose(2, 1, 0)
+            return cols
+        except LinAlgError:
+            pass
+    grams = np.repeat(gram[:, np.newaxis], n_targets, axis=1)
+    del gram
+    segment = np.repeat(np.arange(counts.size), counts)
+    # The outer products of at most one rank x rank matrix per row and
+    # target are materialized at a time, as budgeted by targets_block_bytes.
+    chunk = counts.size * n_targets
+    for target in range(n_targets):
+        missing = np.flatnonzero(~present[:, target])
+        for start in range(0, missing.size, chunk):
+            part = missing[start:start + chunk]
+            owners = segment[part]
+            firsts = np.flatnonzero(np.diff(owners, prepend=-1))
+            outer = submat[part, :, np.newaxis] * submat[part, np.newaxis, :]
+            grams[owners[firsts], target] -= np.add.reduceat(
+                outer, firsts, axis=0
+            )
+            del outer
+    diagonals = grams.reshape(counts.size, n_targets, rank * rank)
+    diagonals[:, :, ::rank + 1] += lambda_ * target_counts[:, :, np.newaxis]
+    empty = target_counts == 0
+    grams[empty] = eye
+    rhs = rhs.transpose(0, 2, 1)
+    try:
+        solved = np.linalg.solve(grams, rhs[..., np.newaxis])[..., 0]
+    except LinAlgError:
+        solved = np.zeros_like(rhs)
+        for index in np.ndindex(*grams.shape[:2]):
+            try:
+                solved[index] = np.linalg.solve(grams[index], rhs[index])
+            except LinAlgError:
+                pass
+    cols[:, :, rated] = solved.transpose(1, 2, 0)
+    return cols
+
+
+def solve_pooled_block(indptr, indices, values, mask, fixed, rows, lambda_):
+    """Solve one feature column per row pooled over every target.
+
+    Each target has its own fixed features, of shape targets x rank x
+    columns, and a row's single column is fit to all of its present values.
+
+    Args:
+        indptr (np.ndarray): Index pointer array of the entries of each row.
+        indices (np.ndarray): The column of the fixed features of each entry.
+        values (np.ndarray): Array of shape entries x targets.
+        mask (np.ndarray): Boolean array of shape entries x targets, True
+            where the value is present.
+        fixed (np.ndarray): Array of shape targets x rank x columns.
+        rows (np.ndarray): Array of the rows of indptr that are to be solved.
+        lambda_ (float): The regularization parameter.
+    Returns:
+        cols (np.ndarray): Array of shape rank x rows.size.
+
+    """
+    rank = fixed.shape[1]
+    rows = np.asarray(rows)
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    cols = np.zeros((rank, rows.size))
+    rated = counts > 0
+    if not rated.any():
+        return cols
+    starts, counts = starts[rated], counts[rated]
+    positions, _ = segment_positions(starts, counts)
+    present = mask[positions]
+    # Every present value becomes an entry of its own, in row order, so the
+    # pooled rows are contiguous segments just as in solve_block.
+    entry, target = np.nonzero(present)
+    n_values = np.add.reduceat(
+        present.sum(axis=1), np.concatenate(([0], np.cumsum(counts)[:-1]))
+    )
+    offsets = np.concatenate(([0], np.cumsum(n_values)[:-1]))
+    submat = fixed[target, :, indices[positions[entry]]]\
+        .astype(float, copy=False)
+    grams = np.empty((counts.size, rank, rank))
+    for dim in range(rank):
+        grams[:, dim] = np.add.reduceat(
+            submat * submat[:, dim, np.newaxis],
+            offsets,
+            axis=0
+        )
+    grams += lambda_ * n_values[:, np.newaxis, np.newaxis] * np.eye(rank)
+    rhs = np.add.reduceat(
+        submat * values[positions[entry], target][:, np.newaxis],
+        offsets,
+        axis=0
+    )
+    try:
+        solved = np.linalg.solve(grams, rhs[:, :, np.newaxis])[:, :, 0]
+    except LinAlgError:
+        solved = np.zeros_like(rhs)
+        for row, (gram, vec) in enumerate(zip(grams, rhs)):
+            try:
+                solved[row] = np.linalg.solve(gram, vec)
+            except LinAlgError:
+                pass
+    cols[:, rated] = solved.T
+    return cols
+
+
+def block_bytes(counts, rank, itemsize=8):
+    """Estimate the bytes allocated by solve_block for the given rows.
+
+    Args:
+        counts (np.ndarray): Array with the number of ratings for each row.
+        rank (int): The rank of the feature arrays.
+        itemsize (int, default=8): Size in bytes of a single feature value.
+    Returns:
+        nbytes (np.ndarray): Array with the estimated bytes for each row.
+
+    """
+    counts = np.asarray(counts)
+    nbytes = itemsize * (
+        counts * (3 * rank + 2) + 2 * rank * rank + 3 * rank
+    )
+    return nbytes
+
+
+def targets_block_bytes(counts, rank, n_targets, itemsize=8):
+    """Estimate the bytes allocated by solve_targets_block for the given rows.
+
+    Besides the entries, every row holds its shared Gram matrix, one copy per
+    target, the copies np.linalg.solve makes of those and at most one chunk
+    of missing value outer products per target.
+
+    Args:
+        counts (np.ndarray): Array with the number of entries for each row.
+        rank (int): The rank of the feature arrays.
+        n_targets (int): The number of targets solved for each row.
+        itemsize (int, default=8): Size in bytes of a single feature value.
+    Returns:
+        nbytes (np.ndarray): Array with the estimated bytes for each row.
+
+    """
+    counts = np.asarray(counts)
+    nbytes = itemsize * (
+        counts * (3 * rank + n_targets + 2)
+        + (3 * n_targets + 1) * rank * rank + 4 * n_targets * rank
+    )
+    return nbytes
+
+
+def split_blocks(counts, rank, max_bytes, n_targets=None):
+    """Split consecutive rows into blocks that fit within a memory budget.
+
+    Rows are never split, so a single row whose own footprint exceeds
+    max_bytes is placed in a block of its own.
+
+    Args:
+        counts (np.ndarray): Array with the number of ratings for each row.
+        rank (int): The rank of the feature arrays.
+        max_bytes (int): The largest number of bytes a block should use.
+        n_targets (int, default=None): The number of targets per row when
+            the rows are solved by solve_targets_block, whose footprint is
+            estimated by targets_block_bytes instead of block_bytes.
+    Returns:
+        bounds (list): List of (start, stop) tuples delimiting each block.
+
+    """
+    if n_targets is None:
+        nbytes = block_bytes(counts, rank)
+    else:
+        nbytes = targets_block_bytes(counts, rank, n_targets)
+    bounds = []
+    start, used = 0, 0
+    for row, size in enumerate(nbytes):
+        if row > start and used + size > max_bytes:
+            bounds.append((start, row))
+            start, used = row, 0
+        used += size
+    if start < len(nbytes):
+        bounds.append((start, len(nbytes)))
+    return bounds
+
+
+def partition_work(counts, rank, n_parts, ordering='natural'):
+    """Split rows into groups of roughly equal solve cost.
+
+    The cost of a row is the cost of building its Gram matrix, proportional
+    to its number of ratings times rank squared, plus the cost of solving it,
+    proportional to rank cubed. Rows are cut into contiguous runs at the
+    quantiles of the cumulative cost, so every group does about the same
+    amount of work however skewed the ratings are.
+
+    Args:
+        counts (np.ndarray): Array with the number of ratings for each row.
+        rank (int): The rank of the feature arrays.
+        n_parts (int): The number of groups to make.
+        ordering (string, default='natural'): Either 'natural' to keep the
+            rows in index order or 'degree' to sort them by descending number
+            of ratings first, so that rows solved together in a block have
+            similar sizes.
+    Returns:
+        groups (list): List of n_parts arrays of row indices, some of which
+            may be empty.
+
+    """
+    counts = np.asarray(counts)
+    if ordering == 'degree':
+        order = np.argsort(-counts, kind='stable')
+    else:
+        order = np.arange(counts.size)
+    cost = np.cumsum(counts[order] * rank ** 2 + rank ** 3, dtype=float)
+    if cost.size == 0:
+        return [order] * n_parts
+    targets = cost[-1] * np.arange(1, n_parts) / n_parts
+    cuts = np.searchsorted(cost, targets, side='right')
+    groups = np.split(order, cuts)
+    return groups
+
+
+def update_columns(arrays, indices, features, params):
+    """Solve and write a group of feature columns.
+
+    The group is solved in blocks sized by split_blocks so that the memory
+    used by the worker never exceeds the max_block_bytes budget by more than
+    the footprint of a single row.
+
+    Args:
+        arrays (dict): Dictionary holding the 'csr_' and 'csc_' prefixed
+            indptr, indices and data arrays of the ratings along with the
+            'user_feats' and 'item_feats' arrays that are written to.
+        indices (np.ndarray): Array of integers representing the index of the
+            user or item columns that are to be updated.
+        features (string): The features that will be updated either 'user' or
+            'item'.
+        params (dict): Parameters for the ALS algorithm.
+    Returns:
+        count (int): The number of columns that were written.
+        peak (int): The estimated bytes used by the largest block.
+        seconds (float): The wall time spent solving the group.
+
+    """
+    began = perf_counter()
+    if features == 'user':
+        fmt, fixed, out = 'csr', arrays['item_feats'], arrays['user_feats']
+    else:
+        fmt, fixed, out = 'csc', arrays['user_feats'], arrays['item_feats']
+    indptr = arrays[fmt + '_indptr']
+    counts = indptr[indices + 1] - indptr[indices]
+    rank = fixed.shape[0]
+    peak = 0
+    cg_steps = params.get('cg_steps')
+    for start, stop in split_blocks(counts, rank, params['max_block_bytes']):
+        block = indices[start:stop]
+        out[:, block] = solve_block(
+            indptr,
+            arrays[fmt + '_indices'],
+            arrays[fmt + '_data'],
+            fixed,
+            block,
+            params['lambda_'],
+            params.get('alpha'),
+            params.get('gramian'),
+            out[:, block] if cg_steps is not None else None,
+            cg_steps
+        )
+        peak = max(peak, block_bytes(counts[start:stop], rank).sum())
+    return len(indices), int(peak), perf_counter() - began
+
+
+def _shared_update(args):
+    """Run update_columns in a worker process against the shared arrays.
+
+    Args:
+        args (tuple): The indices, features and params for update_columns.
+    Returns:
+        result (tuple): The count, peak and seconds returned by
+            update_columns.
+
+    """
+    arrays = {name: view for name, (_, view) in _SHARED.items()}
+    return update_columns(arrays, *args)
 
 
 class ALS(object):
@@ -39,10 +836,63 @@ class ALS(object):
         user_features (np.ndarray): Array of shape m x rank where m represents
             the number of users contained in the data. Contains the latent
             features about users extracted by the factorization process.
+        max_block_bytes (int): The memory budget for a single block of users
+            or items solved by a worker.
+        backend (string): Where the updates run, one of 'serial', 'threads'
+            or 'processes'.
+        n_workers (int): The number of threads or processes in the pool.
+        blas_threads (int or None): The number of BLAS threads each worker
+            may use.
+        ordering (string): Either 'natural' or 'degree', the order in which
+            users and items are assigned to workers.
+        rmse_sample (int or float or None): If set, the training error that
+            decides when fit stops is measured on a random sample of the
+            ratings, either a count or a fraction of all of the ratings.
+        peak_bytes_ (dict): Dictionary with the 'user' and 'item' phases as
+            keys and the estimated peak bytes of the last update of each as
+            values. The peak is the sum over workers of each worker's largest
+            block, an upper bound for the memory in use at once.
+        worker_times_ (dict): Dictionary with the 'user' and 'item' phases as
+            keys and arrays of the seconds each worker group took in the last
+            update of each as values, for measuring load imbalance.
+        worker_nnz_ (dict): Dictionary with the 'user' and 'item' phases as
+            keys and arrays of the number of ratings in each worker group.
+        n_iter_ (int): The number of iterations run by the last fit,
+            including those before a resumed checkpoint.
+        best_iter_ (int or None): The iteration with the lowest validation
+            error in the last fit, whose features the model keeps.
+        history_ (list): The dictionaries passed to the callback for every
+            iteration of the last fit.
+        index_ (MIPSIndex or None): Approximate top-k index over the item
+            features, rebuilt after every fit once build_index has been
+            called.
+        tiles_ (GeoTiles or None): Geographic grid of item features used by
+            recommend_local, refreshed after every fit once set_locations has
+            been called.
+        pending_threshold (int): The number of pending ratings at which they
+            are merged into the CSR ratings.
+        biased (bool): Whether the model learns offsets. A biased prediction
+            is global_mean + user_bias[u] + item_bias[i] + Uu . Ii.
+        bias_lambda (float): The regularization of the offsets.
+        solver (string): Either 'direct' or 'cg'.
+        cg_steps (int): The conjugate gradient steps per half iteration.
+        dtype (string): The floating point type of the features.
+        global_mean (float): The mean of the fit ratings, 0 when not biased.
+        user_bias (np.ndarray or None): The offset of every user.
+        item_bias (np.ndarray or None): The offset of every item.
+        max_iter (int or None): The most iterations a fit may run.
+        patience (int): Iterations without validation improvement before
+            stopping.
 
     """
 
-    def __init__(self, rank, lambda_=0.1, tolerance=0.001, seed=None):
+    def __init__(self, rank, lambda_=0.1, tolerance=0.001, seed=None,
+                 max_block_bytes=MAX_BLOCK_BYTES, rmse_sample=None,
+                 backend='processes', n_workers=None, blas_threads=None,
+                 ordering='natural', max_iter=None, patience=1,
+                 pending_threshold=PENDING_THRESHOLD, biased=False,
+                 bias_lambda=BIAS_LAMBDA, solver='direct', cg_steps=3,
+                 dtype='float64'):
         """Create instance of als with given parameters.
 
         Args:
@@ -52,15 +902,119 @@ class ALS(object):
                 term.
             tolerance (float, default=0.001): Float representing the threshold
                 that a step must be below before update iterations will stop.
+            max_block_bytes (int, default=MAX_BLOCK_BYTES): The memory budget
+                in bytes for a single block of users or items. Blocks never
+                materialize more than this, except for a lone row that alone
+                exceeds the budget.
+            rmse_sample (int or float, default=None): Count, or fraction when
+                below 1, of the ratings sampled once per fit for measuring the
+                training error used for convergence. All ratings are used when
+                None.
+            backend (string, default='processes'): One of 'serial', 'threads'
+                or 'processes'. The pool for the backend is created once and
+                lives for the whole fit.
+            n_workers (int, default=None): The number of threads or processes
+                in the pool, cpu_count() when None. Ignored by 'serial'.
+            blas_threads (int, default=None): The number of BLAS threads each
+                worker may use. When None, workers of the 'threads' and
+                'processes' backends use one BLAS thread each and the 'serial'
+                backend leaves BLAS alone. Limiting BLAS requires
+                threadpoolctl.
+            ordering (string, default='natural'): Either 'natural' to give
+                workers contiguous runs of users or items, or 'degree' to sort
+                them by their number of ratings first for cache locality. In
+                both cases the runs are balanced by their solve cost.
+            max_iter (int, default=None): The most iterations a fit may run,
+                counting those before a resumed checkpoint. Unbounded when
+                None.
+            patience (int, default=1): The number of iterations without an
+                improvement of the validation error after which a fit with
+                validation data stops.
+            pending_threshold (int, default=PENDING_THRESHOLD): The number of
+                ratings added by update_user that are held in the pending
+                overlay before they are merged into the CSR ratings.
+            biased (bool, default=False): Whether to learn a global mean and
+                user and item offsets alongside the features.
+            bias_lambda (float, default=BIAS_LAMBDA): The regularization of
+                the offsets, a number of pseudo ratings at zero offset.
+            solver (string, default='direct'): Either 'direct' to solve every
+                system exactly or 'cg' for a few conjugate gradient steps
+                started from the current columns, which never forms the rank
+                x rank matrices and is faster at high ranks.
+            cg_steps (int, default=3): The conjugate gradient steps per
+                column and half iteration with solver='cg'.
+            dtype (string, default='float64'): The floating point type of the
+                features. 'float32' halves their memory and the bandwidth of
+                every gather and product, while the solves still run in
+                float64.
 
         """
+        if backend not in BACKENDS:
+            raise ValueError(
+                'backend must be one of {}, got {!r}.'
+                .format(BACKENDS, backend)
+            )
+        if ordering not in ORDERINGS:
+            raise ValueError(
+                'ordering must be one of {}, got {!r}.'
+                .format(ORDERINGS, ordering)
+            )
+        if solver not in SOLVERS:
+            raise ValueError(
+                'solver must be one of {}, got {!r}.'
+                .format(SOLVERS, solver)
+            )
+        if np.dtype(dtype).kind != 'f':
+            raise ValueError(
+                'dtype must be a floating point type, got {!r}.'.format(dtype)
+            )
         self.rank = rank
         self.lambda_ = lambda_
         self.tolerance = tolerance
         self.rand = np.random.RandomState(seed)
+        self.max_block_bytes = max_block_bytes
+        self.rmse_sample = rmse_sample
+        self.backend = backend
+        self.n_workers = n_workers or POOL_SIZE
+        self.blas_threads = blas_threads
+        if blas_threads is None and backend != 'serial':
+            self.blas_threads = 1
+        self.ordering = ordering
+        self.max_iter = max_iter
+        self.patience = patience
+        self.pending_threshold = pending_threshold
+        self.biased = biased
+        self.bias_lambda = bias_lambda
+        self.solver = solver
+        self.cg_steps = cg_steps
+        self.dtype = np.dtype(dtype).name
+        self.global_mean = 0.0
+        self.user_bias = None
+        self.item_bias = None
         self.ratings = None
         self.item_feats = None
         self.user_feats = None
+        self.peak_bytes_ = {}
+        self.worker_times_ = {}
+        self.worker_nnz_ = {}
+        self.n_iter_ = 0
+        self.best_iter_ = None
+        self.history_ = []
+        self.index_ = None
+        self.tiles_ = None
+        self._user_buf = None
+        self._bias_buf = None
+        self._indptr_buf = None
+        self._residuals = None
+        self._pending = {}
+        self._n_pending = 0
+        self._dirty_users = set()
+        self._dirty_items = set()
+        self._user_cache = OrderedDict()
+        self._cache_feats = None
+        self._shared = None
+        self._pool = None
+        self._ratings_data = None
 
     @staticmethod
     def root_mean_squared_error(true, pred):
@@ -77,77 +1031,328 @@ class ALS(object):
         rmse = np.sqrt(mse)
         return rmse
 
-    def make_item_submats(self):
-        """Construct array of all the item submatrices from a ratings matrix.
-
-        Returns:
-            submats (np.ndarray): Array containing the submatrix constructed by
-                selecting the columns from the item features for the ratings
-                that exist for each row in the ratings matrix.
-
-        """
-        idx = self.ratings.indptr
-        col_arr = self.item_feats[:, self.ratings.indices]
-        submat_list = [
-            col_arr[:, row:col] for row, col in zip(idx[:-1], idx[1:])
-        ]
-        submats = np.empty(len(submat_list), dtype=object)
-        for row, submat in enumerate(submat_list):
-            submats[row] = submat
-        return submats
+    @property
+    def ratings_data(self):
+        """Return the cached RatingsData for the current ratings.
 
-    def make_user_submats(self):
-        """Construct array of all the user submatrices from a ratings matrix.
+        The cache is built on first use and dropped whenever the ratings are
+        modified through update_user or add_user. Building it replaces the
+        ratings with its compact CSR matrix, so they are held only once.
 
         Returns:
-            submats (np.ndarray): Array containing the submatrix constructed by
-                selecting the columns from the user features for the ratings
-                that exist for each column in the ratings matrix.
+            data (RatingsData): Dual format view of the ratings.
 
         """
-        ratings = self.ratings.tocsc()
-        idx = ratings.indptr
-        col_arr = self.user_feats[:, ratings.indices]
-        submat_list = [
-            col_arr[:, row:col] for row, col in zip(idx[:-1], idx[1:])
-        ]
-        submats = np.empty(len(submat_list), dtype=object)
-        for row, submat in enumerate(submat_list):
-            submats[row] = submat
-        return submats
+        if self._ratings_data is None:
+            self._ratings_data = RatingsData(self.ratings)
+            self.ratings = self._ratings_data.csr
+        return self._ratings_data
 
-    def fit(self, ratings):
+    def fit(self, ratings, init=None, checkpoint=None, validation=None,
+            callback=None):
         """Fit the model to the given ratings.
 
         Args:
             ratings (numpy.ndarray or scipy.sparse): Ratings matrix of users x
                 items.
+            init (ALS, default=None): A previously fit model of the same rank
+                to warm start from. Its features are used for the users and
+                items it knows about and any users or items appended since are
+                initialized as in a cold start.
+            checkpoint (string, default=None): Path of a .npz file the
+                features are written to after every iteration. If the file
+                exists when fit is called the fit resumes from it, and it is
+                removed once the fit converges.
+            validation (pd.DataFrame or scipy.sparse, default=None): Held out
+                ratings in the format accepted by score. When given, the fit
+                stops once the validation error has not improved for patience
+                iterations and the features from the best iteration are kept.
+            callback (callable, default=None): Called after every iteration
+                with a dictionary holding the 'iteration', 'train_rmse',
+                'validation_rmse' and the 'timings' in seconds of the 'user',
+                'item' and 'rmse' phases. Returning True stops the fit.
 
         """
+        if self._pending:
+            ratings = self._merge_pending(ratings)
         self.ratings = ratings
-        rmse = float('inf')
-        diff = rmse
-        self.item_feats = self.rand.rand(self.rank * self.ratings.shape[1])\
-            .reshape((self.rank, self.ratings.shape[1]))
-        course_avg = self.ratings.sum(0) / (self.ratings != 0).sum(0)
-        course_avg[np.isnan(course_avg)] = 0
+        self._ratings_data = None
+        data = self.ratings_data
+        self._init_features(data, init)
+        rmse, self.n_iter_ = float('inf'), 0
+        if checkpoint is not None and path.exists(checkpoint):
+            rmse = self._load_checkpoint(checkpoint)
+        diff = float('inf')
+        sample = self._rmse_sample(data.nnz)
+        users, items = data.rows[sample], data.cols[sample]
+        true = self._targets(data.csr.data[sample])
+        if validation is not None:
+            users_val, items_val, ratings_val = self._score_pairs(validation)
+            validation = (users_val, items_val, self._targets(ratings_val))
+        self.history_, self.best_iter_ = [], None
+        best_rmse, best_feats, stale = float('inf'), None, 0
+        with self._fit_context(data):
+            while diff > self.tolerance and (
+                    self.max_iter is None or self.n_iter_ < self.max_iter):
+                timings = self._fit_iteration()
+                began = perf_counter()
+                pred = self.predict_pairs(users, items)
+                new_rmse = self.root_mean_squared_error(true, pred)
+                val_rmse = None
+                if validation is not None:
+                    val_rmse = self.root_mean_squared_error(
+                        validation[2],
+                        self.predict_pairs(validation[0], validation[1])
+                    )
+                timings['rmse'] = perf_counter() - began
+                diff = rmse - new_rmse
+                rmse = new_rmse
+                self.n_iter_ += 1
+                info = {
+                    'iteration': self.n_iter_,
+                    'train_rmse': rmse,
+                    'validation_rmse': val_rmse,
+                    'timings': timings
+                }
+                self.history_.append(info)
+                stop = callback is not None and callback(info)
+                if checkpoint is not None:
+                    self._save_checkpoint(checkpoint, rmse)
+                if val_rmse is not None:
+                    if val_rmse < best_rmse:
+                        best_rmse, stale = val_rmse, 0
+                        self.best_iter_ = self.n_iter_
+                        best_feats = (
+                            self.user_feats.copy(),
+                            self.item_feats.copy(),
+                            self._copy_biases()
+                        )
+                    else:
+                        stale += 1
+                        stop = stop or stale >= self.patience
+                if stop:
+                    break
+            if best_feats is not None and self.best_iter_ != self.n_iter_:
+                self.user_feats[...] = best_feats[0]
+                self.item_feats[...] = best_feats[1]
+                if self.biased:
+                    self.user_bias, self.item_bias = best_feats[2]
+        if checkpoint is not None and path.exists(checkpoint):
+            remove(checkpoint)
+        self._dirty_users, self._dirty_items = set(), set()
+        self._refresh_item_copies()
+
+    def _fit_context(self, data):
+        """Return the context the iterations of a fit run in.
+
+        Args:
+            data (RatingsData): The ratings being fit.
+        Returns:
+            context (contextmanager): The backend pool of the fit.
+
+        """
+        return self._worker_pool()
+
+    def _fit_iteration(self):
+        """Run one iteration of a fit, a user then an item update.
+
+        Returns:
+            timings (dict): The seconds taken by the 'user' and 'item'
+                updates.
+
+        """
+        timings = {}
+        began = perf_counter()
+        self.update_users()
+        timings['user'] = perf_counter() - began
+        began = perf_counter()
+        self.update_items()
+        timings['item'] = perf_counter() - began
+        return timings
+
+    def partial_fit(self, sweeps=1):
+        """Refit only the users and items that changed since the last fit.
+
+        update_user only moves the vector of the user who rated, so the items
+        that received new ratings go stale between fits. The changed users and
+        items, along with their one hop neighbours (the users who rated a
+        changed item and the items rated by a changed user), are re-solved
+        for the given number of alternating sweeps on the configured backend
+        while every other column stays fixed. Pending ratings are merged
+        first so that the solves see them.
+
+        Args:
+            sweeps (int, default=1): The number of user then item sweeps.
+        Returns:
+            users (np.ndarray): The users that were re-solved.
+            items (np.ndarray): The items that were re-solved.
+
+        """
+        self.merge_pending()
+        data = self.ratings_data
+        dirty_users = np.array(sorted(self._dirty_users), dtype=int)
+        dirty_items = np.array(sorted(self._dirty_items), dtype=int)
+        if not dirty_users.size and not dirty_items.size:
+            return dirty_users, dirty_items
+        csr, csc = data.csr, data.csc
+        positions, _ = segment_positions(
+            csc.indptr[dirty_items], data.col_counts[dirty_items]
+        )
+        users = np.union1d(dirty_users, csc.indices[positions])
+        positions, _ = segment_positions(
+            csr.indptr[dirty_users], data.row_counts[dirty_users]
+        )
+        items = np.union1d(dirty_items, csr.indices[positions])
+        with self._worker_pool():
+            for _ in range(sweeps):
+                self.update_users(users)
+                self.update_items(items)
+        self._dirty_users, self._dirty_items = set(), set()
+        self._user_cache.clear()
+        self._refresh_item_copies()
+        return users, items
+
+    def _refresh_item_copies(self):
+        """Rebuild index_ and refresh tiles_ from the item features."""
+        if self.index_ is not None:
+            self.build_index(
+                self.index_.n_lists,
+                self.index_.n_probe,
+                self.index_.seed
+            )
+        if self.tiles_ is not None:
+            self.tiles_.refresh(self._item_scoring())
+
+    def _init_features(self, data, init=None):
+        """Initialize the feature matrices before a fit.
+
+        Item features are drawn at random with the first feature set to the
+        item's average rating and user features start at zero. A biased model
+        keeps the item features small and random instead and starts its
+        offsets at zero around the global mean. When init is given its
+        features overwrite those of the users and items it covers. They are
+        taken before any array is replaced, so init may be the model itself.
+
+        Args:
+            data (RatingsData): The ratings being fit.
+            init (ALS, default=None): A previously fit model to warm start
+                from.
+
+        """
+        if init is not None:
+            if init.rank != self.rank:
+                raise ValueError(
+                    'Cannot warm start a rank {} model from a rank {} model.'
+                    .format(self.rank, init.rank)
+                )
+            init_feats = (init.user_feats, init.item_feats)
+            init_biases = None
+            if self.biased and init.biased:
+                init_biases = (init.user_bias, init.item_bias)
+        n_users, n_items = data.shape
+        self.item_feats = self.rand.rand(self.rank * n_items)\
+            .reshape((self.rank, n_items)).astype(self.dtype)
+        course_avg = np.bincount(
+            data.cols,
+            weights=data.csr.data,
+            minlength=n_items
+        ) / data.col_counts
+        course_avg[~np.isfinite(course_avg)] = 0
         self.item_feats[0] = course_avg
-        self.user_feats = np.zeros(self.rank * self.ratings.shape[0])\
-            .reshape((self.rank, self.ratings.shape[0]))
-        while diff > self.tolerance:
-            self.update_users()
-            self.update_items()
-            true = self.ratings.data
-            non_zeros = self.ratings.nonzero()
-            pred = np.array(
-                [
-                    self.predict_one(user, item)
-                    for user, item in zip(non_zeros[0], non_zeros[1])
-                ]
+        self.user_feats = np.zeros((self.rank, n_users), dtype=self.dtype)
+        if self.biased:
+            self.item_feats[0] = self.rand.rand(n_items)
+            self.item_feats *= 0.1
+            self.global_mean = float(data.csr.data.mean()) if data.nnz else 0.
+            self.user_bias = np.zeros(n_users)
+            self.item_bias = np.zeros(n_items)
+        if init is None:
+            return
+        known_users = min(n_users, init_feats[0].shape[1])
+        known_items = min(n_items, init_feats[1].shape[1])
+        self.user_feats[:, :known_users] = init_feats[0][:, :known_users]
+        self.item_feats[:, :known_items] = init_feats[1][:, :known_items]
+        if init_biases is not None:
+            self.user_bias[:known_users] = init_biases[0][:known_users]
+            self.item_bias[:known_items] = init_biases[1][:known_items]
+
+    def _copy_biases(self):
+        """Return copies of the user and item offsets, None if not biased."""
+        if not self.biased:
+            return None
+        return self.user_bias.copy(), self.item_bias.copy()
+
+    def _save_checkpoint(self, checkpoint, rmse):
+        """Atomically write the current features to a checkpoint file.
+
+        Args:
+            checkpoint (string): Path of the .npz checkpoint file.
+            rmse (float): The training error after the last iteration.
+
+        """
+        temp = checkpoint + '.tmp'
+        with open(temp, 'wb') as checkpoint_file:
+            biases = {}
+            if self.biased:
+                biases = {
+                    'user_bias': self.user_bias,
+                    'item_bias': self.item_bias
+                }
+            np.savez(
+                checkpoint_file,
+                user_feats=self.user_feats,
+                item_feats=self.item_feats,
+                rmse=rmse,
+                n_iter=self.n_iter_,
+                **biases
             )
-            new_rmse = self.root_mean_squared_error(true, pred)
-            diff = rmse - new_rmse
-            rmse = new_rmse
+        replace(temp, checkpoint)
+
+    def _load_checkpoint(self, checkpoint):
+        """Restore the features from a checkpoint file.
+
+        Args:
+            checkpoint (string): Path of the .npz checkpoint file.
+        Returns:
+            rmse (float): The training error when the checkpoint was written.
+
+        """
+        with np.load(checkpoint) as saved:
+            user_feats, item_feats = saved['user_feats'], saved['item_feats']
+            if user_feats.shape != self.user_feats.shape or \
+                    item_feats.shape != self.item_feats.shape:
+                raise ValueError(
+                    'Checkpoint {} does not match the ratings and rank being '
+                    'fit.'.format(checkpoint)
+                )
+            self.user_feats[...] = user_feats
+            self.item_feats[...] = item_feats
+            if self.biased and 'user_bias' in saved:
+                self.user_bias[...] = saved['user_bias']
+                self.item_bias[...] = saved['item_bias']
+            self.n_iter_ = int(saved['n_iter'])
+            rmse = float(saved['rmse'])
+        return rmse
+
+    def _rmse_sample(self, nnz):
+        """Select the ratings used to measure the training error.
+
+        Args:
+            nnz (int): The number of stored ratings.
+        Returns:
+            sample (slice or np.ndarray): Slice over all ratings or a sorted
+                array of the sampled rating positions.
+
+        """
+        if self.rmse_sample is None:
+            return slice(None)
+        size = self.rmse_sample
+        if size < 1:
+            size = int(np.ceil(size * nnz))
+        if size >= nnz:
+            return slice(None)
+        sample = np.sort(self.rand.choice(nnz, int(size), replace=False))
+        return sample
 
     def predict_one(self, user, item):
         """Given a user and item provide the predicted rating.
@@ -159,7 +1364,7 @@ class ALS(object):
         Formula:
             rating = UiIj
             Where Ui is the row of features for user i and Ij is the column of
-            features for item j.
+            features for item j. A biased model adds global_mean + bi + bj.
 
         Args:
             user (int): Integer representing the user id.
@@ -168,9 +1373,37 @@ class ALS(object):
             rating (float): Float value of the predicted rating.
 
         """
-        rating = self.user_feats.T[user].dot(self.item_feats[:, item])
+        rating = self.user_feats.T[user].dot(self.item_feats[:, item])\
+            + self._offsets(user, item)
         return rating
 
+    def predict_pairs(self, users, items, chunk_size=PREDICT_CHUNK):
+        """Given arrays of users and items provide the predicted ratings.
+
+        The feature columns for the pairs are gathered chunk_size pairs at a
+        time so that only two rank x chunk_size arrays exist at once.
+
+        Args:
+            users (np.ndarray): Array of integers representing user ids.
+            items (np.ndarray): Array of integers representing item ids, the
+                same length as users.
+            chunk_size (int, default=PREDICT_CHUNK): The number of pairs to
+                predict at once.
+        Returns:
+            ratings (np.ndarray): Array of the predicted rating for each pair.
+
+        """
+        users, items = np.asarray(users), np.asarray(items)
+        ratings = np.empty(users.size)
+        for start in range(0, users.size, chunk_size):
+            stop = start + chunk_size
+            ratings[start:stop] = np.einsum(
+                'ij,ij->j',
+                self.user_feats[:, users[start:stop]],
+                self.item_feats[:, items[start:stop]]
+            ) + self._offsets(users[start:stop], items[start:stop])
+        return ratings
+
     def predict_all(self, user):
         """Given a user provide all of the predicted ratings.
 
@@ -182,169 +1415,739 @@ class ALS(object):
 
         """
         ratings = self.user_feats.T[user].dot(self.item_feats)
+        if self.biased:
+            ratings += self.global_mean + self.user_bias[user]\
+                + self.item_bias
         return ratings
 
-    def score(self, true):
-        """Return the root mean squared error for the predicted values.
+    def _offsets(self, users, items):
+        """Return the offsets added to the predictions of user, item pairs.
 
         Args:
-            true (pd.DataFrame): A pandas DataFrame structured with the
-                columns, 'Rating', 'User', 'Item'.
+            users (int or np.ndarray): User ids.
+            items (int or np.ndarray): Item ids, broadcast against users.
+        Returns:
+            offsets (float or np.ndarray): global_mean + user_bias + item_bias
+                for a biased model, otherwise 0.
+
+        """
+        if not self.biased:
+            return 0.
+        return self.global_mean + self.user_bias[users] + self.item_bias[items]
+
+    def _item_scoring(self):
+        """Return the item matrix that top-k searches score against.
+
+        A biased model appends item_bias as an extra row so that an index or
+        tile built from it ranks by Uu . Ii + bi, with the user vectors from
+        _user_scoring. The global mean and user offset are constant per user
+        and are added to the scores afterwards.
 
         Returns:
-            rmse (float): The root mean squared error for the test set given
-                the values predicted by the model.
+            feats (np.ndarray): Array of shape rank x items, or rank + 1 x
+                items for a biased model.
 
         """
-        if not isinstance(self.item_feats, np.ndarray):
-            raise Exception('The model must be fit before generating a score.')
-        ratings = csr_matrix((true.Rating, (true.User, true.Item)))
-        non_zeros = ratings.nonzero()
-        pred = np.array(
-            [
-                self.predict_one(user, item)
-                for user, item in zip(non_zeros[0], non_zeros[1])
-            ]
-        )
-        rmse = self.root_mean_squared_error(ratings.data, pred)
-        return rmse
+        if not self.biased:
+            return self.item_feats
+        return np.vstack((self.item_feats, self.item_bias))
 
-    def fit_transform(self, ratings):
-        """Fit model to ratings and return predicted ratings.
+    def _user_scoring(self, users):
+        """Return the user vectors that match _item_scoring.
 
         Args:
-            ratings (numpy.ndarray or scipy.sparse): Ratings matrix of users x
-                items.
+            users (int or np.ndarray): A user id or an array of user ids.
         Returns:
-            predictions (numpy.ndarray): Matrix of all predicted ratings.
+            vectors (np.ndarray): The user features with a row of ones
+                appended for a biased model.
 
         """
-        self.fit(ratings)
-        predictions = self.user_feats.T.dot(self.item_feats)
-        return predictions
-
-    def update_users(self):
-        """Update the user features."""
-        user_arrays = np.array_split(
-            np.arange(self.ratings.shape[0]),
-            POOL_SIZE
-        )
-        item_submats = self.make_item_submats()
-        item_submat_arrays = np.array_split(item_submats, POOL_SIZE)
-        rows = np.array_split(
-            np.array(
-                np.hsplit(self.ratings.data, self.ratings.indptr[1:-1])
-            ),
-            POOL_SIZE
-        )
-        self._update_parallel(user_arrays, item_submat_arrays, rows, 'user')
+        vectors = self.user_feats[:, users]
+        if not self.biased:
+            return vectors
+        return np.concatenate((vectors, np.ones((1,) + vectors.shape[1:])))
 
-    def update_items(self):
-        """Update the item features."""
-        item_arrays = np.array_split(
-            np.arange(self.ratings.shape[1]),
-            POOL_SIZE
-        )
-        user_submats = self.make_user_submats()
-        user_submat_arrays = np.array_split(user_submats, POOL_SIZE)
-        rows = np.array_split(
-            np.array(
-                np.hsplit(
-                    self.ratings.tocsc().data,
-                    self.ratings.tocsc().indptr[1:-1]
-                )
-            ),
-            POOL_SIZE
-        )
-        self._update_parallel(item_arrays, user_submat_arrays, rows, 'item')
+    def recommend(self, users, k=10, exclude_rated=True, exclude=None,
+                  items=None):
+        """Return the top k items and their predicted ratings for users.
 
-    def _update_parallel(self, arrays, submat_arrays, rows, features):
-        """Update the given features in parallel.
+        All of the users are scored with a single matrix product and the top
+        k of each row are found with argpartition, so only the k best items
+        are ever sorted.
 
         Args:
-            arrays (np.ndarray): Array of indices that represent which column
-                of the features is being updated.
-            submat_arrays (np.ndarray): Array of submatrices that will be used
-                to calculate the update.
-            rows (np.ndarray): Array of arrays that contain the ratings for the
-                given feature column.
-            features (string): The features that will be updated either 'user'
-                or 'item'
+            users (int or np.ndarray): A user id or an array of user ids.
+            k (int, default=10): The number of items to recommend to each
+                user. All candidate items are ranked when None.
+            exclude_rated (bool, default=True): Whether to leave out the items
+                each user has already rated.
+            exclude (np.ndarray, default=None): Item ids to leave out for all
+                users, such as closed courses.
+            items (np.ndarray, default=None): Item ids to restrict the
+                candidates to, such as the courses near a location. Ids the
+                model does not know are ignored.
+        Returns:
+            ids (np.ndarray): Array of shape k, or users x k for an array of
+                users, with the recommended item ids best first. When fewer
+                than k items remain after the exclusions the ids are padded
+                with -1.
+            scores (np.ndarray): Array of the predicted ratings aligned with
+                ids, padded with -inf.
 
         """
-        with ProcessPoolExecutor() as pool:
-            params = {'rank': self.rank, 'lambda_': self.lambda_}
-            results = pool.map(
-                self._thread_update_features,
-                zip(arrays, submat_arrays, rows, repeat(params))
+        single = np.ndim(users) == 0
+        users = np.atleast_1d(users)
+        rows, rated = None, None
+        if exclude_rated:
+            rows, rated = self._rated_items(users)
+        ids, scores = self._top_k(
+            self.user_feats[:, users], k, exclude, items, rows, rated,
+            self.global_mean + self.user_bias[users] if self.biased else None
+        )
+        if single:
+            return ids[0], scores[0]
+        return ids, scores
+
+    def _top_k(self, vectors, k, exclude, items, rows, rated, offsets=None):
+        """Rank the candidate items for each column of vectors.
+
+        Args:
+            vectors (np.ndarray): Array of shape rank x queries.
+            k (int or None): The number of items to return per query. All
+                candidate items are ranked when None.
+            exclude (np.ndarray or None): Item ids to leave out for all
+                queries.
+            items (np.ndarray or None): Item ids to restrict the candidates
+                to.
+            rows (np.ndarray or None): The query of each entry of rated.
+            rated (np.ndarray or None): Item ids to leave out for the query
+                in rows.
+            offsets (np.ndarray, default=None): The global mean plus the
+                offset of each query for a biased model. The item offsets are
+                added here.
+        Returns:
+            ids (np.ndarray): Array of shape queries x k with the item ids best
+                first, padded with -1.
+            scores (np.ndarray): Array of the predicted ratings aligned with
+                ids, padded with -inf.
+
+        """
+        n_items = self.item_feats.shape[1]
+        if items is None:
+            candidates = np.arange(n_items)
+        else:
+            candidates = np.unique(np.asarray(items, dtype=int))
+            candidates = candidates[(candidates >= 0) & (candidates < n_items)]
+        n_queries = vectors.shape[1]
+        scores = vectors.T.dot(self.item_feats[:, candidates])
+        if self.biased:
+            scores += self.item_bias[candidates]
+            if offsets is not None:
+                scores += np.asarray(offsets)[:, np.newaxis]
+        if exclude is not None:
+            scores[:, np.isin(candidates, exclude)] = -np.inf
+        if rated is not None:
+            pos = np.searchsorted(candidates, rated)
+            found = pos < candidates.size
+            found[found] = candidates[pos[found]] == rated[found]
+            scores[rows[found], pos[found]] = -np.inf
+        k = candidates.size if k is None else min(k, candidates.size)
+        if k < candidates.size:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(candidates.size), (n_queries, 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        ids = np.where(np.isneginf(top_scores), -1, candidates[top])
+        return ids, top_scores
+
+    def fold_in(self, item_ids, ratings):
+        """Solve feature vectors for users that are not in the model.
+
+        Each vector is the regularized least squares solution against the
+        fixed item features, exactly as a fit would solve a user row, but no
+        state of the model is changed, so it is safe to call from many
+        threads while the model serves other requests. Many users are solved
+        together in blocks within max_block_bytes.
+
+        Args:
+            item_ids (np.ndarray or list): The items rated by one user, or a
+                list with an array of rated items for each user.
+            ratings (np.ndarray or list): The ratings aligned with item_ids.
+        Returns:
+            vectors (np.ndarray): A feature vector of length rank, or an array
+                of shape rank x users for a list of users. A user without
+                ratings gets a zero vector. For a biased model the vectors fit
+                the ratings less the global mean and item offsets, and the
+                user offset is left at zero.
+
+        """
+        single = np.ndim(item_ids[0]) == 0 if len(item_ids) else True
+        if single:
+            item_ids, ratings = [item_ids], [ratings]
+        counts = np.array([len(ids) for ids in item_ids], dtype=int)
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        indices = np.concatenate(
+            [np.asarray(ids, dtype=int) for ids in item_ids] + [[]]
+        ).astype(int)
+        data = np.concatenate(
+            [np.asarray(vals, dtype=float) for vals in ratings] + [[]]
+        )
+        if self.biased:
+            data = data - self.global_mean - self.item_bias[indices]
+        vectors = np.zeros((self.rank, counts.size))
+        update_columns(
+            {
+                'csr_indptr': indptr,
+                'csr_indices': indices,
+                'csr_data': data,
+                'item_feats': self.item_feats,
+                'user_feats': vectors
+            },
+            np.arange(counts.size),
+            'user',
+            dict(self._solve_params('user'), cg_steps=None)
+        )
+        if single:
+            return vectors[:, 0]
+        return vectors
+
+    def recommend_for_vector(self, vectors, k=10, exclude=None, items=None,
+                             rated=None):
+        """Return the top k items for feature vectors, such as from fold_in.
+
+        Args:
+            vectors (np.ndarray): A feature vector of length rank or an array
+                of shape rank x users.
+            k (int, default=10): The number of items to recommend to each
+                vector. All candidate items are ranked when None.
+            exclude (np.ndarray, default=None): Item ids to leave out for all
+                vectors, such as closed courses.
+            items (np.ndarray, default=None): Item ids to restrict the
+                candidates to.
+            rated (np.ndarray or list, default=None): The items already rated
+                by a single vector, or a list with the rated items of each
+                vector, which are left out.
+        Returns:
+            ids (np.ndarray): Array of shape k, or users x k, with the item
+                ids best first, padded with -1.
+            scores (np.ndarray): Array of the predicted ratings aligned with
+                ids, padded with -inf.
+
+        """
+        single = np.ndim(vectors) == 1
+        vectors = np.asarray(vectors).reshape(self.rank, -1)
+        rows = None
+        if rated is not None:
+            if single:
+                rated = [rated]
+            rows = np.repeat(
+                np.arange(len(rated)), [len(ids) for ids in rated]
             )
-            for result in results:
-                for index, value in result.items():
-                    if features == 'item':
-                        self.item_feats[:, index] = value
-                    else:
-                        self.user_feats[:, index] = value
-
-    def _thread_update_features(self, args):
-        """Split updates of feature matrices to multiple threads.
-
-        Args:
-            indices (np.ndarray): Array of integers representing the index of
-                the user or item that is to be updated.
-            submats (np.ndarray): Array of submatrices that will be used for
-                updating the features.
-            rows (np.ndarray): Array of rows that contain the ratings for the
-                given user or item.
-            params (dict): Parameters for the ALS algorithm
-        Returns:
-            data (dict): Dictionary of data with the user or item to be updated
-                as key and the array of features as the values.
-
-        """
-        indices, submats, rows, params = args
-        rank = params['rank']
-        lambda_ = params['lambda_']
-        data = {}
-        with ThreadPoolExecutor() as pool:
-            threads = {
-                pool.submit(
-                    self._update_one,
-                    item_submat,
-                    row,
-                    rank,
-                    lambda_
-                ): ind for ind, item_submat, row in zip(indices, submats, rows)
-            }
-        for thread in as_completed(threads):
-            ind = threads[thread]
-            result = thread.result()
-            data[ind] = result
-        return data
+            rated = np.concatenate(
+                [np.asarray(ids, dtype=int) for ids in rated] + [[]]
+            ).astype(int)
+        ids, scores = self._top_k(
+            vectors, k, exclude, items, rows, rated,
+            np.full(vectors.shape[1], self.global_mean)
+        )
+        if single:
+            return ids[0], scores[0]
+        return ids, scores
+
+    def build_index(self, n_lists=None, n_probe=8, seed=None):
+        """Build the approximate top-k index over the item features.
+
+        Once built, the index is rebuilt with the same parameters at the end
+        of every fit so that it never serves stale features.
+
+        Args:
+            n_lists (int, default=None): The number of clusters, the square
+                root of the number of items when None.
+            n_probe (int, default=8): The default number of clusters scored
+                per query, trading latency for recall.
+            seed (int, default=None): Seed for the k-means initialization.
+        Returns:
+            index (MIPSIndex): The built index, also stored as index_.
+
+        """
+        self.index_ = MIPSIndex(n_lists, n_probe, seed)\
+            .build(self._item_scoring())
+        return self.index_
+
+    def recommend_approximate(self, users, k=10, n_probe=None):
+        """Return the approximate top k items for users from index_.
+
+        Unlike recommend, rated items are not excluded. Ask for extra items
+        and filter them if needed.
+
+        Args:
+            users (int or np.ndarray): A user id or an array of user ids.
+            k (int, default=10): The number of items to return per user.
+            n_probe (int, default=None): The number of clusters to score,
+                the index default when None.
+        Returns:
+            ids (np.ndarray): Array of shape k, or users x k, with the item ids
+                best first.
+            scores (np.ndarray): Array of the predicted ratings aligned with
+                ids.
+
+        """
+        if self.index_ is None:
+            raise Exception('build_index must be called before searching.')
+        ids, scores = self.index_.search(
+            self._user_scoring(users), k, n_probe
+        )
+        if self.biased:
+            scores = scores + np.expand_dims(
+                self.global_mean + self.user_bias[users], -1
+            )
+        return ids, scores
+
+    def set_locations(self, ids, lats, lngs, cell_deg=1.0):
+        """Tile the items by location for use by recommend_local.
+
+        Args:
+            ids (np.ndarray): The item ids that have a location. Ids the model
+                does not know are ignored.
+            lats (np.ndarray): The latitude of each item in degrees.
+            lngs (np.ndarray): The longitude of each item in degrees.
+            cell_deg (float, default=1.0): The size of a grid cell in degrees.
+        Returns:
+            tiles (GeoTiles): The grid, also stored as tiles_.
+
+        """
+        ids = np.asarray(ids, dtype=int)
+        known = (ids >= 0) & (ids < self.item_feats.shape[1])
+        self.tiles_ = GeoTiles(cell_deg).build(
+            ids[known],
+            np.asarray(lats, float)[known],
+            np.asarray(lngs, float)[known],
+            self._item_scoring()
+        )
+        return self.tiles_
+
+    def recommend_local(self, user, lat, lng, radius_miles=100, k=None,
+                        exclude_rated=True, exclude=None):
+        """Return the top items within a radius of a location for a user.
+
+        Only the grid cells the radius touches are scored.
+
+        Args:
+            user (int): Integer representing the user id.
+            lat (float): Latitude of the center in degrees.
+            lng (float): Longitude of the center in degrees.
+            radius_miles (float, default=100): Radius of the search in miles.
+            k (int, default=None): The number of items to return, all of the
+                items within the radius when None.
+            exclude_rated (bool, default=True): Whether to leave out the items
+                the user has already rated.
+            exclude (np.ndarray, default=None): Item ids to leave out, such as
+                closed courses.
+        Returns:
+            ids (np.ndarray): The item ids best first, at most k of them.
+            scores (np.ndarray): The predicted ratings aligned with ids.
+
+        """
+        if self.tiles_ is None:
+            raise Exception('set_locations must be called before searching.')
+        ids, scores = self.tiles_.score(
+            self._user_scoring(user), lat, lng, radius_miles
+        )
+        if self.biased:
+            scores = scores + self.global_mean + self.user_bias[user]
+        keep = np.ones(ids.size, dtype=bool)
+        if exclude is not None:
+            keep &= ~np.isin(ids, exclude)
+        if exclude_rated:
+            keep &= ~np.isin(ids, self._rated_items(np.array([user]))[1])
+        ids, scores = ids[keep], scores[keep]
+        k = ids.size if k is None else min(k, ids.size)
+        if k < ids.size:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return ids[order], scores[order]
+
+    def _rated_items(self, users):
+        """Return the items rated by each of the given users.
+
+        Pending ratings are included, so an item may appear twice.
+
+        Args:
+            users (np.ndarray): Array of user ids.
+        Returns:
+            rows (np.ndarray): The position in users of each rating.
+            items (np.ndarray): The item of each rating.
+
+        """
+        ratings = self.ratings
+        if not isspmatrix_csr(ratings):
+            ratings = self.ratings_data.csr
+        inside = users < ratings.shape[0]
+        starts = np.zeros(users.size, dtype=int)
+        counts = np.zeros(users.size, dtype=int)
+        starts[inside] = ratings.indptr[users[inside]]
+        counts[inside] = ratings.indptr[users[inside] + 1] - starts[inside]
+        positions, _ = segment_positions(starts, counts)
+        rows = np.repeat(np.arange(users.size), counts)
+        items = ratings.indices[positions]
+        if self._pending:
+            extra = [
+                (row, item) for row, user in enumerate(users.tolist())
+                for item in self._pending.get(user, ())
+            ]
+            if extra:
+                extra_rows, extra_items = np.array(extra).T
+                rows = np.concatenate((rows, extra_rows))
+                items = np.concatenate((items, extra_items))
+        return rows, items
+
+    def score(self, true):
+        """Return the root mean squared error for the predicted values.
+
+        Args:
+            true (pd.DataFrame or scipy.sparse): A pandas DataFrame
+                structured with the columns, 'Rating', 'User', 'Item' or a
+                sparse users x items matrix of ratings.
+
+        Returns:
+            rmse (float): The root mean squared error for the test set given
+                the values predicted by the model.
+
+        """
+        if not isinstance(self.item_feats, np.ndarray):
+            raise Exception('The model must be fit before generating a score.')
+        users, items, ratings = self._score_pairs(true)
+        pred = self.predict_pairs(users, items)
+        rmse = self.root_mean_squared_error(self._targets(ratings), pred)
+        return rmse
 
     @staticmethod
-    def _update_one(submat, row, rank, lam):
-        """Update a single column for one of the feature matrices.
+    def _score_pairs(true):
+        """Return the users, items and ratings of a set of true ratings.
 
         Args:
-            submat (np.ndarray): Submatrix of columns or rows from ratings
-                corresponding to the reviews by a user or on an item.
-            row (np.ndarray): Array of the ratings for the given item or user.
-            rank (int): The rank of the feature arrays.
-            lambda_ (float): The regularization parameter.
+            true (pd.DataFrame or scipy.sparse): A pandas DataFrame with the
+                columns 'Rating', 'User', 'Item' or a sparse users x items
+                matrix of ratings.
         Returns:
-            col (np.ndarray): An array that represents a column from the
-                feature matrix that is to be updated.
+            users (np.ndarray): Array of the user of each rating.
+            items (np.ndarray): Array of the item of each rating.
+            ratings (np.ndarray): Array of the rating values.
 
         """
-        num_ratings = row.size
-        reg_sums = submat.dot(submat.T)\
-            + lam * num_ratings * np.eye(rank)
-        feature_sums = submat.dot(row[np.newaxis].T)
+        if issparse(true):
+            ratings = true.tocoo()
+        else:
+            ratings = csr_matrix((true.Rating, (true.User, true.Item))).tocoo()
+        return ratings.row, ratings.col, ratings.data
+
+    def fit_transform(self, ratings):
+        """Fit model to ratings and return predicted ratings.
+
+        Args:
+            ratings (numpy.ndarray or scipy.sparse): Ratings matrix of users x
+                items.
+        Returns:
+            predictions (numpy.ndarray): Matrix of all predicted ratings.
+
+        """
+        self.fit(ratings)
+        predictions = self.user_feats.T.dot(self.item_feats)
+        if self.biased:
+            predictions += self.global_mean\
+                + self.user_bias[:, np.newaxis] + self.item_bias
+        return predictions
+
+    @contextmanager
+    def _share_arrays(self):
+        """Place the ratings and feature matrices in shared memory.
+
+        While the context is active user_feats and item_feats are views into
+        the shared blocks so that worker processes write directly into them.
+        A biased model shares its residuals in place of the ratings so that
+        they can be refreshed before every half iteration. On exit the
+        features are copied back into private arrays and the blocks are
+        released.
+
+        """
+        if self._shared is not None:
+            yield self._shared
+            return
+        data = self.ratings_data
+        csr, csc = data.csr, data.csc
+        csr_data, csc_data = csr.data, csc.data
+        if self.biased:
+            residuals = self._residual_arrays()
+            csr_data, csc_data = residuals['csr'], residuals['csc']
+        self._shared = SharedArrays({
+            'csr_indptr': csr.indptr,
+            'csr_indices': csr.indices,
+            'csr_data': csr_data,
+            'csc_indptr': csc.indptr,
+            'csc_indices': csc.indices,
+            'csc_data': csc_data,
+            'user_feats': self.user_feats,
+            'item_feats': self.item_feats
+        })
+        self.user_feats = self._shared.arrays['user_feats']
+        self.item_feats = self._shared.arrays['item_feats']
+        if self.biased:
+            residuals['csr'] = self._shared.arrays['csr_data']
+            residuals['csc'] = self._shared.arrays['csc_data']
         try:
-            col = np.linalg.inv(reg_sums).dot(feature_sums)
-        except LinAlgError:
-            col = np.zeros((1, rank))
-        return col.flatten()
+            yield self._shared
+        finally:
+            self.user_feats = np.array(self.user_feats)
+            self.item_feats = np.array(self.item_feats)
+            if self.biased:
+                residuals['csr'] = np.array(residuals['csr'])
+                residuals['csc'] = np.array(residuals['csc'])
+            self._shared.close()
+            self._shared = None
+
+    @contextmanager
+    def _worker_pool(self):
+        """Start the backend pool that is used for the duration of a fit.
+
+        For the 'processes' backend the arrays are placed in shared memory and
+        every worker attaches to them once when it starts. The 'threads' and
+        'serial' backends work on the arrays directly and limit BLAS in this
+        process instead.
+
+        """
+        if self._pool is not None:
+            yield self._pool
+            return
+        with ExitStack() as stack:
+            if self.backend == 'processes':
+                stack.enter_context(self._share_arrays())
+                self._pool = stack.enter_context(ProcessPoolExecutor(
+                    self.n_workers,
+                    initializer=init_worker,
+                    initargs=(self._shared.specs, self.blas_threads)
+                ))
+            else:
+                limits = limit_blas_threads(self.blas_threads)
+                if limits is not None:
+                    stack.enter_context(limits)
+                if self.backend == 'threads':
+                    self._pool = stack.enter_context(
+                        ThreadPoolExecutor(self.n_workers)
+                    )
+            try:
+                yield self._pool
+            finally:
+                self._pool = None
+
+    def _local_arrays(self):
+        """Return the arrays used by update_columns in this process.
+
+        Returns:
+            arrays (dict): Dictionary of the ratings and feature arrays.
+
+        """
+        data = self.ratings_data
+        arrays = {
+            'user_feats': self.user_feats,
+            'item_feats': self.item_feats
+        }
+        for fmt, matrix in (('csr', data.csr), ('csc', data.csc)):
+            arrays[fmt + '_indptr'] = matrix.indptr
+            arrays[fmt + '_indices'] = matrix.indices
+            arrays[fmt + '_data'] = matrix.data
+            if self.biased:
+                arrays[fmt + '_data'] = self._residual_arrays()[fmt]
+        return arrays
+
+    def _residual_arrays(self):
+        """Return the residual buffers a biased model solves its features on.
+
+        Returns:
+            residuals (dict): Dictionary holding the RatingsData 'data' the
+                buffers belong to, the 'csr' and 'csc' ordered residuals and
+                the 'order' of the csc entries among the csr entries.
+
+        """
+        data = self.ratings_data
+        if self._residuals is None or self._residuals['data'] is not data:
+            self._residuals = {
+                'data': data,
+                'order': np.lexsort((data.rows, data.cols)),
+                'csr': np.array(data.csr.data, dtype=float),
+                'csc': np.array(data.csc.data, dtype=float)
+            }
+        return self._residuals
+
+    def _update_residuals(self, fmt):
+        """Write the ratings less the offsets into one residual buffer.
+
+        Args:
+            fmt (string): Either 'csr' before the user features are solved or
+                'csc' before the item features are.
+
+        """
+        residuals = self._residual_arrays()
+        data = residuals['data']
+        values = data.csr.data - self._offsets(data.rows, data.cols)
+        if fmt == 'csc':
+            values = values[residuals['order']]
+        residuals[fmt][...] = values
+
+    def _update_biases(self, features, indices=None):
+        """Refit the user or item offsets given everything else.
+
+        Each offset is the regularized mean of the residuals of its ratings,
+        computed for all of them with a single bincount over the coordinates
+        of the ratings.
+
+        Args:
+            features (string): Either 'user' or 'item'.
+            indices (np.ndarray, default=None): The offsets to update, all of
+                them when None.
+
+        """
+        data = self.ratings_data
+        resid = data.csr.data - self.predict_pairs(data.rows, data.cols)
+        if features == 'user':
+            coords, counts, bias = data.rows, data.row_counts, self.user_bias
+        else:
+            coords, counts, bias = data.cols, data.col_counts, self.item_bias
+        sums = np.bincount(
+            coords,
+            weights=resid + bias[coords],
+            minlength=counts.size
+        )
+        means = sums / (counts + self.bias_lambda)
+        if indices is None:
+            bias[:counts.size] = means
+        else:
+            bias[indices] = means[indices]
+
+    def _solve_params(self, features):
+        """Return the params passed to update_columns for a half iteration.
+
+        Args:
+            features (string): The features that will be updated either 'user'
+                or 'item'.
+        Returns:
+            params (dict): Parameters for the ALS algorithm.
+
+        """
+        return {
+            'lambda_': self.lambda_,
+            'max_block_bytes': self.max_block_bytes,
+            'cg_steps': self.cg_steps if self.solver == 'cg' else None
+        }
+
+    def _targets(self, values):
+        """Return the values the predictions are fit to for stored ratings.
+
+        Args:
+            values (np.ndarray): Array of stored ratings.
+        Returns:
+            targets (np.ndarray): The ratings themselves.
+
+        """
+        return values
+
+    def update_users(self, users=None):
+        """Update the user features, and the user offsets of a biased model.
+
+        Args:
+            users (np.ndarray, default=None): The users to update, all of them
+                when None.
+
+        """
+        if self.biased:
+            self._update_residuals('csr')
+        self._update_parallel(self.ratings_data.shape[0], 'user', users)
+        if self.biased:
+            self._update_biases('user', users)
+
+    def update_items(self, items=None):
+        """Update the item features, and the item offsets of a biased model.
+
+        Args:
+            items (np.ndarray, default=None): The items to update, all of them
+                when None.
+
+        """
+        if self.biased:
+            self._update_residuals('csc')
+        self._update_parallel(self.ratings_data.shape[1], 'item', items)
+        if self.biased:
+            self._update_biases('item', items)
+
+    def _update_parallel(self, size, features, indices=None):
+        """Update the given features on the configured backend.
+
+        The columns to update are split into one group per worker with
+        partition_work, so that each group holds about the same number of
+        ratings. Workers solve their columns in memory bounded blocks and
+        write them in place, returning only the number of columns solved, the
+        size of their largest block and the time they took. Process workers do
+        so against the shared arrays they attached to when the pool started.
+
+        Args:
+            size (int): The number of columns in the features being updated.
+            features (string): The features that will be updated either 'user'
+                or 'item'
+            indices (np.ndarray, default=None): The columns to update, all
+                size of them when None.
+
+        """
+        if self._pool is None and self.backend != 'serial':
+            with self._worker_pool():
+                self._update_parallel(size, features, indices)
+            return
+        params = self._solve_params(features)
+        data = self.ratings_data
+        counts = data.row_counts if features == 'user' else data.col_counts
+        n_parts = 1 if self._pool is None else self.n_workers
+        if indices is None:
+            groups = partition_work(counts, self.rank, n_parts, self.ordering)
+        else:
+            indices = np.asarray(indices, dtype=int)
+            size = indices.size
+            groups = [
+                indices[group] for group in partition_work(
+                    counts[indices], self.rank, n_parts, self.ordering
+                )
+            ]
+        if self._pool is None:
+            results = [update_columns(
+                self._local_arrays(), groups[0], features, params
+            )]
+        else:
+            if self.backend == 'processes':
+                results = list(self._pool.map(
+                    _shared_update,
+                    zip(groups, repeat(features), repeat(params))
+                ))
+            else:
+                results = list(self._pool.map(
+                    partial(update_columns, self._local_arrays()),
+                    groups,
+                    repeat(features),
+                    repeat(params)
+                ))
+        solved = sum(count for count, _, _ in results)
+        self.peak_bytes_[features] = sum(peak for _, peak, _ in results)
+        self.worker_times_[features] = np.array(
+            [seconds for _, _, seconds in results]
+        )
+        self.worker_nnz_[features] = np.array(
+            [counts[group].sum() for group in groups]
+        )
+        if solved != size:
+            raise RuntimeError(
+                'Only {} of {} {} columns were updated.'
+                .format(solved, size, features)
+            )
 
     def update_user(self, user, item, rating):
         """Update a single user's feature vector.
@@ -354,16 +2157,255 @@ class ALS(object):
         the entire model should be rebuilt, but this is as close to a real-time
         update as is possible.
 
+        The regularized Gram matrix of the user, its inverse and the right
+        hand side are cached for recently updated users, so a new rating is a
+        Sherman-Morrison rank-one update of the inverse and a changed rating
+        only moves the right hand side, both O(rank^2) however many courses
+        the user has reviewed. See _rank_one_update for the drift check.
+
+        Inserting into a CSR matrix shifts all of the ratings after the new
+        one, so the rating is held in a pending overlay instead. The overlay is
+        consulted by update_user, recommend and fit and is merged into the CSR
+        ratings in a single batch once it holds pending_threshold ratings, or
+        when merge_pending is called. The user and item are marked as changed
+        for partial_fit. The offsets of a biased model are left as they are
+        and the features fit the ratings less the offsets.
+
         Args:
             user (int): Integer representing the user id.
             item (int): Integer representing the item id.
             rating (int): Integer value of the rating assigned to item by user.
         """
-        self.ratings[user, item] = rating
-        submat = self.item_feats[:, self.ratings[user].indices]
-        row = self.ratings[user].data
-        col = self._update_one(submat, row, self.rank, self.lambda_)
+        user, item = int(user), int(item)
+        items, row = self.user_ratings(user)
+        old = row[items == item]
+        pending = self._pending.setdefault(user, {})
+        if item not in pending:
+            self._n_pending += 1
+        pending[item] = rating
+        self._dirty_users.add(user)
+        self._dirty_items.add(item)
+        state = self._cached_state(user)
+        col = None
+        if state is not None:
+            offset = self._offsets(user, item)
+            col = self._rank_one_update(
+                state, self.item_feats[:, item], rating - offset,
+                old[0] - offset if old.size else None
+            )
+        if col is None:
+            items, row = self.user_ratings(user)
+            state, col = self._user_state(
+                items, row - self._offsets(user, items)
+            )
+            if state is not None:
+                self._user_cache[user] = state
+                if len(self._user_cache) > USER_CACHE_SIZE:
+                    self._user_cache.popitem(last=False)
         self.user_feats[:, user] = col
+        if self.n_pending >= self.pending_threshold:
+            self.merge_pending()
+
+    def _cached_state(self, user):
+        """Return the cached solver state of a user or None.
+
+        The cache is dropped whenever the item features were replaced, for
+        instance by a fit, since every cached Gram matrix is built from them.
+
+        Args:
+            user (int): Integer representing the user id.
+        Returns:
+            state (dict or None): The state made by _user_state.
+
+        """
+        if self._cache_feats is not self.item_feats:
+            self._user_cache.clear()
+            self._cache_feats = self.item_feats
+            return None
+        state = self._user_cache.get(user)
+        if state is not None:
+            self._user_cache.move_to_end(user)
+        return state
+
+    def _user_state(self, items, row):
+        """Solve for a user's features from scratch and keep the solver state.
+
+        Args:
+            items (np.ndarray): The items rated by the user.
+            row (np.ndarray): The rating of each item.
+        Returns:
+            state (dict or None): The 'gram' matrix Y Y^T + lambda n0 I, its
+                'inverse', the right hand side 'rhs' Y r, the number of
+                ratings 'n0' the regularization of gram uses and the current
+                number of ratings 'n'. None when gram is singular.
+            col (np.ndarray): The feature vector of the user.
+
+        """
+        gram, rhs = self._normal_equations(items, row)
+        try:
+            inverse = np.linalg.inv(gram)
+        except LinAlgError:
+            return None, np.zeros(self.rank)
+        state = {
+            'gram': gram,
+            'inverse': inverse,
+            'rhs': rhs,
+            'n0': row.size,
+            'n': row.size
+        }
+        return state, inverse.dot(rhs)
+
+    def _normal_equations(self, items, row):
+        """Return the Gram matrix and right hand side of one user.
+
+        Args:
+            items (np.ndarray): The items rated by the user.
+            row (np.ndarray): The rating of each item.
+        Returns:
+            gram (np.ndarray): Array of shape rank x rank.
+            rhs (np.ndarray): Array of length rank.
+
+        """
+        submat = self.item_feats[:, items].astype(float, copy=False)
+        gram = submat.dot(submat.T)\
+            + self.lambda_ * row.size * np.eye(self.rank)
+        rhs = submat.dot(row)
+        return gram, rhs
+
+    @staticmethod
+    def _rating_terms(rating, old=None):
+        """Return how one rating changes the normal equations of a user.
+
+        Args:
+            rating (float): The new rating.
+            old (float, default=None): The previous rating, None when the item
+                is newly rated.
+        Returns:
+            weight (float): The weight of the rank-one Gram matrix update.
+            rhs_step (float): The multiple of the item features added to the
+                right hand side.
+            n_step (int): The change in the number of ratings.
+
+        """
+        if old is None:
+            return 1, rating, 1
+        return 0, rating - old, 0
+
+    def _rank_one_update(self, state, item_vec, rating, old=None):
+        """Update the cached state of a user with one rating.
+
+        A new rating adds item_vec item_vec^T to the Gram matrix, which the
+        inverse follows with a Sherman-Morrison update, and lambda I to the
+        regularization, which is not low rank. The inverse therefore stays
+        regularized with n0 ratings and the system with n ratings is solved
+        by iterative refinement, each step using the cached inverse. The
+        residual is measured against the explicitly summed Gram matrix, so
+        drift of the inverse, or too many ratings since n0, shows up as a
+        residual that does not converge and the caller re-solves from scratch.
+
+        Args:
+            state (dict): The state made by _user_state, updated in place.
+            item_vec (np.ndarray): The features of the rated item.
+            rating (float): The new rating.
+            old (float, default=None): The previous rating of the item by the
+                user, None when the item is newly rated.
+        Returns:
+            col (np.ndarray or None): The feature vector of the user, None
+                when the refinement did not converge.
+
+        """
+        weight, rhs_step, n_step = self._rating_terms(rating, old)
+        if weight:
+            gram, inverse = state['gram'], state['inverse']
+            proj = inverse.dot(item_vec)
+            inverse -= weight * np.outer(proj, proj)\
+                / (1 + weight * item_vec.dot(proj))
+            gram += weight * np.outer(item_vec, item_vec)
+        state['rhs'] += rhs_step * item_vec
+        state['n'] += n_step
+        shift = self.lambda_ * (state['n'] - state['n0'])
+        rhs = state['rhs']
+        col = state['inverse'].dot(rhs)
+        tol = REFINE_TOL * max(np.linalg.norm(rhs), 1)
+        for _ in range(REFINE_STEPS):
+            resid = rhs - state['gram'].dot(col) - shift * col
+            if np.linalg.norm(resid) <= tol:
+                return col
+            col += state['inverse'].dot(resid)
+        return None
+
+    @property
+    def n_pending(self):
+        """Return the number of ratings held in the pending overlay."""
+        return self._n_pending
+
+    def user_ratings(self, user):
+        """Return the items a user rated and the ratings, pending included.
+
+        Args:
+            user (int): Integer representing the user id.
+        Returns:
+            items (np.ndarray): The items rated by the user.
+            ratings (np.ndarray): The rating of each item. A pending rating
+                replaces a stored one for the same item.
+
+        """
+        ratings = self.ratings
+        if not isspmatrix_csr(ratings):
+            ratings = self.ratings_data.csr
+        items, row = np.array([], dtype=int), np.array([])
+        if user < ratings.shape[0]:
+            start, stop = ratings.indptr[user], ratings.indptr[user + 1]
+            items, row = ratings.indices[start:stop], ratings.data[start:stop]
+        pending = self._pending.get(int(user))
+        if pending:
+            new_items = np.fromiter(pending, dtype=int, count=len(pending))
+            keep = ~np.isin(items, new_items)
+            items = np.concatenate((items[keep], new_items))
+            row = np.concatenate((row[keep], list(pending.values())))
+        return items, row
+
+    def merge_pending(self):
+        """Merge the pending overlay into the CSR ratings in one batch."""
+        if self._pending:
+            self.ratings = self._merge_pending(self.ratings)
+            self._ratings_data = None
+
+    def _merge_pending(self, ratings):
+        """Return ratings with the pending overlay merged in and clear it.
+
+        Args:
+            ratings (numpy.ndarray or scipy.sparse): Ratings matrix of users x
+                items.
+        Returns:
+            merged (scipy.sparse.csr_matrix): The ratings with every pending
+                rating inserted or replacing the stored one.
+
+        """
+        pending = [
+            (user, item, rating) for user, items in self._pending.items()
+            for item, rating in items.items()
+        ]
+        users, items, values = (np.array(column) for column in zip(*pending))
+        coo = csr_matrix(ratings).tocoo()
+        n_items = coo.shape[1]
+        keep = ~np.isin(
+            coo.row.astype(np.int64) * n_items + coo.col,
+            users.astype(np.int64) * n_items + items
+        )
+        merged = csr_matrix(
+            (
+                np.concatenate((coo.data[keep], values)),
+                (
+                    np.concatenate((coo.row[keep], users)),
+                    np.concatenate((coo.col[keep], items))
+                )
+            ),
+            shape=(max(coo.shape[0], users.max() + 1), n_items)
+        )
+        self._pending = {}
+        self._n_pending = 0
+        return merged
 
     def add_user(self, user_id):
         """Add a user to the model.
@@ -378,15 +2420,438 @@ class ALS(object):
             user_id (int): The index of the user in the ratings matrix.
 
         """
-        shape = self.ratings.shape
-        if user_id >= shape[0]:
-            self.ratings._shape = (  # pylint: disable=W0212
-                shape[0] + 1,
-                shape[1]
+        self.add_users([user_id])
+
+    def add_users(self, user_ids):
+        """Add several users to the model at once.
+
+        The ratings and user_feats grow to cover the largest of user_ids. Both
+        the user features and the index pointer of the ratings live in
+        GrowableArray buffers, so adding users costs amortized constant time
+        however large the model is. A buffer is only rebuilt when the array it
+        backs was replaced, for instance by a fit.
+
+        Args:
+            user_ids (np.ndarray): The indices of the users in the ratings
+                matrix.
+
+        """
+        user_ids = np.atleast_1d(user_ids)
+        ratings = self.ratings
+        if not isspmatrix_csr(ratings):
+            ratings = csr_matrix(ratings)
+        size = max(
+            ratings.shape[0],
+            self.user_feats.shape[1],
+            int(user_ids.max()) + 1
+        )
+        if size == ratings.shape[0] == self.user_feats.shape[1]:
+            return
+        self._ratings_data = None
+        if self._user_buf is None or \
+                self._user_buf.view is not self.user_feats:
+            self._user_buf = GrowableArray(self.user_feats)
+        self.user_feats = self._user_buf.grow(size)
+        if self.biased:
+            if self._bias_buf is None or \
+                    self._bias_buf.view is not self.user_bias:
+                self._bias_buf = GrowableArray(self.user_bias)
+            self.user_bias = self._bias_buf.grow(size)
+        if self._indptr_buf is None or \
+                self._indptr_buf.view is not ratings.indptr:
+            self._indptr_buf = GrowableArray(ratings.indptr)
+        indptr = self._indptr_buf.grow(size + 1, fill=ratings.indptr[-1])
+        self.ratings = csr_matrix(
+            (ratings.data, ratings.indices, indptr),
+            shape=(size, ratings.shape[1]),
+            copy=False
+        )
+
+
+class ImplicitALS(ALS):
+    """Weighted ALS for implicit feedback such as page views and clicks.
+
+    Follows Hu, Koren and Volinsky, Collaborative Filtering for Implicit
+    Feedback Datasets. The ratings hold the strength r of each interaction,
+    such as a count. Every user has preference one for the items it
+    interacted with and zero for all others, with confidence 1 + alpha * r,
+    so the loss covers every user, item pair. The Gram matrix of all of the
+    fixed features is computed once per half iteration and every row only
+    adds the weighted features of its own interactions, so a sweep costs
+    O(nnz * rank^2 + n * rank^3) however many items there are.
+
+    The predictions are preference scores rather than ratings, and the error
+    reported by fit and score is that of the preference on the stored
+    interactions.
+
+    Attributes:
+        alpha (float): The confidence scale of an interaction.
+
+    """
+
+    def __init__(self, rank, alpha=40.0, **kwargs):
+        """Create instance of implicit als with given parameters.
+
+        Args:
+            rank (int): Integer representing the rank of the matrix
+                factorization.
+            alpha (float, default=40.0): The confidence scale of an
+                interaction.
+            **kwargs: The parameters of ALS.
+
+        """
+        if kwargs.get('biased'):
+            raise ValueError('ImplicitALS does not support biased=True.')
+        super().__init__(rank, **kwargs)
+        self.alpha = alpha
+
+    def _solve_params(self, features):
+        """Return the params of a half iteration with the fixed gramian.
+
+        Args:
+            features (string): The features that will be updated either 'user'
+                or 'item'.
+        Returns:
+            params (dict): Parameters for the ALS algorithm.
+
+        """
+        params = super()._solve_params(features)
+        fixed = self.item_feats if features == 'user' else self.user_feats
+        params['alpha'] = self.alpha
+        params['gramian'] = fixed.dot(fixed.T).astype(float)
+        return params
+
+    def _targets(self, values):
+        """Return the preference of one for every stored interaction.
+
+        Args:
+            values (np.ndarray): Array of stored interaction strengths.
+        Returns:
+            targets (np.ndarray): Array of ones.
+
+        """
+        return np.ones_like(values, dtype=float)
+
+    def _normal_equations(self, items, row):
+        """Return the Gram matrix and right hand side of one user.
+
+        Args:
+            items (np.ndarray): The items the user interacted with.
+            row (np.ndarray): The strength of each interaction.
+        Returns:
+            gram (np.ndarray): Array of shape rank x rank.
+            rhs (np.ndarray): Array of length rank.
+
+        """
+        submat = self.item_feats[:, items].astype(float, copy=False)
+        conf = self.alpha * np.asarray(row, dtype=float)
+        gram = self.item_feats.dot(self.item_feats.T).astype(float)\
+            + (submat * conf).dot(submat.T)\
+            + self.lambda_ * np.eye(self.rank)
+        rhs = submat.dot(1 + conf)
+        return gram, rhs
+
+    def _rating_terms(self, rating, old=None):
+        """Return how one interaction changes the normal equations of a user.
+
+        Args:
+            rating (float): The new interaction strength.
+            old (float, default=None): The previous strength, None when the
+                item is new to the user.
+        Returns:
+            weight (float): The weight of the rank-one Gram matrix update.
+            rhs_step (float): The multiple of the item features added to the
+                right hand side.
+            n_step (int): Always zero since the regularization does not
+                depend on the number of interactions.
+
+        """
+        if old is None:
+            return self.alpha * rating, 1 + self.alpha * rating, 0
+        return self.alpha * (rating - old), self.alpha * (rating - old), 0
+
+
+class MultiCriteriaALS(object):
+    """ALS over several sub-ratings of the same reviews at once.
+
+    A review rates a course overall and on criteria such as Conditions,
+    Layout or Pace. Every user has one taste vector shared by all criteria and
+    every course has one feature vector per criterion, so a prediction for
+    criterion t is Uu . It,i. Each course's Gram matrix over the users who
+    reviewed it is built once per iteration and all criteria are solved from
+    it as multiple right hand sides, with per-criterion corrections where
+    reviews leave a sub-rating out. Each user is fit to every sub-rating it
+    gave, pooling the little data sparse users have.
+
+    Attributes:
+        rank (int): Integer representing the rank of the matrix factorization.
+        lambda_ (float): The regularization penalty.
+        tolerance (float): The improvement of the training error below which
+            a fit stops.
+        max_block_bytes (int): The memory budget of a block of solves.
+        max_iter (int or None): The most iterations a fit may run.
+        criteria (list): The names of the criteria in the order of the
+            features.
+        user_feats (np.ndarray): Array of shape rank x users.
+        item_feats (np.ndarray): Array of shape criteria x rank x items.
+        n_iter_ (int): The number of iterations run by the last fit.
+        history_ (list): The training error of each criterion after every
+            iteration of the last fit.
+
+    """
+
+    def __init__(self, rank, lambda_=0.1, tolerance=0.001, seed=None,
+                 max_block_bytes=MAX_BLOCK_BYTES, max_iter=None):
+        """Create instance of multi-criteria als with given parameters.
+
+        Args:
+            rank (int): Integer representing the rank of the matrix
+                factorization.
+            lambda_ (float, default=0.1): The regularization penalty.
+            tolerance (float, default=0.001): The improvement of the mean
+                training error below which a fit stops.
+            seed (int, default=None): Seed for the random initialization.
+            max_block_bytes (int, default=MAX_BLOCK_BYTES): The largest
+                estimated number of bytes a block of solves may use.
+            max_iter (int, default=None): The most iterations a fit may run.
+                Unbounded when None.
+
+        """
+        self.rank = rank
+        self.lambda_ = lambda_
+        self.tolerance = tolerance
+        self.rand = np.random.RandomState(seed)
+        self.max_block_bytes = max_block_bytes
+        self.max_iter = max_iter
+        self.criteria = []
+        self.user_feats = None
+        self.item_feats = None
+        self.n_iter_ = 0
+        self.history_ = []
+
+    @staticmethod
+    def _stack(ratings):
+        """Align the ratings of every criterion on their union of entries.
+
+        Args:
+            ratings (dict): Dictionary of criterion name to a sparse users x
+                items matrix of its ratings, all of the same shape.
+        Returns:
+            criteria (list): The criterion names.
+            csr (scipy.sparse.csr_matrix): The union of the entries, its data
+                holding one plus the position of each entry in values.
+            values (np.ndarray): Array of shape entries x criteria.
+            mask (np.ndarray): Boolean array of shape entries x criteria.
+
+        """
+        criteria = list(ratings)
+        mats = [csr_matrix(ratings[name]).tocoo() for name in criteria]
+        shape = mats[0].shape
+        if any(mat.shape != shape for mat in mats):
+            raise ValueError('The ratings of every criterion must share a '
+                             'shape.')
+        keys = [mat.row.astype(np.int64) * shape[1] + mat.col for mat in mats]
+        union = np.unique(np.concatenate(keys))
+        values = np.zeros((union.size, len(criteria)))
+        mask = np.zeros((union.size, len(criteria)), dtype=bool)
+        for target, (key, mat) in enumerate(zip(keys, mats)):
+            pos = np.searchsorted(union, key)
+            values[pos, target] = mat.data
+            mask[pos, target] = True
+        rows, cols = np.divmod(union, shape[1])
+        csr = csr_matrix(
+            (np.arange(1, union.size + 1), (rows, cols)), shape=shape
+        )
+        return criteria, csr, values, mask
+
+    def fit(self, ratings):
+        """Fit the model to the ratings of every criterion.
+
+        Args:
+            ratings (dict): Dictionary of criterion name, such as 'Rating' or
+                'Pace', to a sparse users x items matrix of its ratings. A
+                review that leaves a criterion out has no entry in that
+                criterion's matrix.
+
+        """
+        self.criteria, csr, values, mask = self._stack(ratings)
+        csc = csr.tocsc()
+        n_users, n_items = csr.shape
+        csr_order, csc_order = csr.data - 1, csc.data - 1
+        entries = {
+            'user': (csr.indptr, csr.indices, values[csr_order],
+                     mask[csr_order]),
+            'item': (csc.indptr, csc.indices, values[csc_order],
+                     mask[csc_order])
+        }
+        n_targets = len(self.criteria)
+        item_counts = np.diff(csc.indptr)
+        course_avg = np.zeros((n_targets, n_items))
+        cols = np.repeat(np.arange(n_items), item_counts)
+        for target in range(n_targets):
+            present = entries['item'][3][:, target]
+            course_avg[target] = np.bincount(
+                cols[present],
+                weights=entries['item'][2][present, target],
+                minlength=n_items
+            ) / np.maximum(np.bincount(cols[present], minlength=n_items), 1)
+        self.item_feats = self.rand.rand(n_targets, self.rank, n_items)
+        self.item_feats[:, 0] = course_avg
+        self.user_feats = np.zeros((self.rank, n_users))
+        rows = np.repeat(np.arange(n_users), np.diff(csr.indptr))
+        rmse, diff = float('inf'), float('inf')
+        self.history_, self.n_iter_ = [], 0
+        while diff > self.tolerance and (
+                self.max_iter is None or self.n_iter_ < self.max_iter):
+            self._update('user', entries['user'], n_targets)
+            self._update('item', entries['item'], n_targets)
+            errors = self._errors(rows, csr.indices, *entries['user'][2:])
+            self.history_.append(dict(zip(self.criteria, errors)))
+            new_rmse = float(np.mean(errors))
+            diff, rmse = rmse - new_rmse, new_rmse
+            self.n_iter_ += 1
+
+    def _update(self, features, entries, n_targets):
+        """Solve the user or item features in memory bounded blocks.
+
+        Args:
+            features (string): Either 'user' or 'item'.
+            entries (tuple): The indptr, indices, values and mask of the
+                entries in the order of the features being solved.
+            n_targets (int): The number of criteria.
+
+        """
+        indptr, indices, values, mask = entries
+        counts = np.diff(indptr)
+        if features == 'user':
+            bounds = split_blocks(
+                counts * n_targets, self.rank, self.max_block_bytes
+            )
+        else:
+            bounds = split_blocks(
+                counts, self.rank, self.max_block_bytes, n_targets
+            )
+        for start, stop in bounds:
+            block = np.arange(start, stop)
+            if features == 'user':
+                self.user_feats[:, block] = solve_pooled_block(
+                    indptr, indices, values, mask, self.item_feats, block,
+                    self.lambda_
+                )
+            else:
+                self.item_feats[:, :, block] = solve_targets_block(
+                    indptr, indices, values, mask, self.user_feats, block,
+                    self.lambda_
+                )
+
+    def _errors(self, users, items, values, mask):
+        """Return the root mean squared error of every criterion.
+
+        Args:
+            users (np.ndarray): The user of each entry.
+            items (np.ndarray): The item of each entry.
+            values (np.ndarray): Array of shape entries x criteria.
+            mask (np.ndarray): Boolean array of shape entries x criteria.
+        Returns:
+            errors (list): The error of each criterion, nan if it has no
+                ratings.
+
+        """
+        errors = []
+        for target in range(len(self.criteria)):
+            present = mask[:, target]
+            if not present.any():
+                errors.append(float('nan'))
+                continue
+            pred = self.predict_pairs(
+                users[present], items[present], self.criteria[target]
+            )
+            errors.append(ALS.root_mean_squared_error(
+                values[present, target], pred
+            ))
+        return errors
+
+    def _target(self, criterion):
+        """Return the position of a criterion given its name or position."""
+        if isinstance(criterion, str):
+            return self.criteria.index(criterion)
+        return criterion
+
+    def predict_one(self, user, item, criterion):
+        """Given a user, item and criterion provide the predicted rating.
+
+        Args:
+            user (int): Integer representing the user id.
+            item (int): Integer representing the item id.
+            criterion (string or int): The criterion name or position.
+        Returns:
+            rating (float): Float value of the predicted rating.
+
+        """
+        target = self._target(criterion)
+        rating = self.user_feats[:, user].dot(self.item_feats[target, :, item])
+        return rating
+
+    def predict_pairs(self, users, items, criterion,
+                      chunk_size=PREDICT_CHUNK):
+        """Given arrays of users and items provide one criterion's ratings.
+
+        Args:
+            users (np.ndarray): Array of integers representing user ids.
+            items (np.ndarray): Array of integers representing item ids, the
+                same length as users.
+            criterion (string or int): The criterion name or position.
+            chunk_size (int, default=PREDICT_CHUNK): The number of pairs to
+                predict at once.
+        Returns:
+            ratings (np.ndarray): Array of the predicted rating for each pair.
+
+        """
+        feats = self.item_feats[self._target(criterion)]
+        users, items = np.asarray(users), np.asarray(items)
+        ratings = np.empty(users.size)
+        for start in range(0, users.size, chunk_size):
+            stop = start + chunk_size
+            ratings[start:stop] = np.einsum(
+                'ij,ij->j',
+                self.user_feats[:, users[start:stop]],
+                feats[:, items[start:stop]]
             )
-        self.ratings.indptr = np.hstack(
-            (self.ratings.indptr, self.ratings.indptr[-1])
+        return ratings
+
+    def predict_all(self, user, criterion=None):
+        """Given a user provide the predicted ratings of all items.
+
+        Args:
+            user (int): Integer representing the user id.
+            criterion (string or int, default=None): The criterion name or
+                position, every criterion when None.
+        Returns:
+            ratings (np.ndarray): Array of the predictions for all items, or
+                of shape criteria x items when criterion is None.
+
+        """
+        if criterion is None:
+            return np.einsum('r,trj->tj', self.user_feats[:, user],
+                             self.item_feats)
+        ratings = self.user_feats[:, user].dot(
+            self.item_feats[self._target(criterion)]
         )
-        if user_id >= self.user_feats.shape[1]:
-            new_col = np.zeros(self.rank).reshape(-1, 1)
-            self.user_feats = np.hstack((self.user_feats, new_col))
+        return ratings
+
+    def score(self, ratings):
+        """Return the root mean squared error of every criterion.
+
+        Args:
+            ratings (dict): Dictionary of criterion name to a sparse users x
+                items matrix of held out ratings.
+        Returns:
+            errors (dict): Dictionary of criterion name to its error.
+
+        """
+        errors = {}
+        for name, true in ratings.items():
+            true = csr_matrix(true).tocoo()
+            pred = self.predict_pairs(true.row, true.col, name)
+            errors[name] = ALS.root_mean_squared_error(true.data, pred)
+        return errors
@@ -1,7 +1,6 @@
 """Module containing the User class."""
 
 from flask_login import UserMixin
-import numpy as np
 
 from . import APP, BCRYPT
 
@@ -46,10 +45,13 @@ class User(UserMixin):
         return self.username
 
     def get_sorted_recs(self):
-        """Get user's sorted predicted ratings."""
-        recs = APP.config['MODEL'].predict_all(self.user_id)
-        recs = np.ma.masked_array(recs, mask=np.zeros(recs.size))
-        sorted_recs = recs.argsort()[::-1]
+        """Get user's unreviewed courses sorted by predicted rating."""
+        sorted_recs, _ = APP.config['MODEL'].recommend(
+            self.user_id,
+            k=None,
+            exclude=APP.config['CLOSED']
+        )
+        sorted_recs = sorted_recs[sorted_recs >= 0]
         return sorted_recs
 
     def update(self):
@@ -1,6 +1,5 @@
 """Module with utility methods used by the different views."""
 
-import pickle
 import re
 
 from flask_login import current_user
@@ -37,7 +36,12 @@ def do_review(review_doc):
         review_doc['Course Id'],
         review_doc['Rating']
     )
-    save_model()
+    log_model_update(
+        'update_user',
+        current_user.user_id,
+        review_doc['Course Id'],
+        review_doc['Rating']
+    )
     result = APP.config['GRREVIEWS_COLLECTION'].insert_one(review_doc)
     APP.config['REVIEWS_COLLECTION'].insert_one(review_doc)
     if not result.inserted_id:
@@ -149,6 +153,40 @@ def get_sorted_index(course_ids, sorted_recs):
     return indices
 
 
+def get_local_ranked(loc):
+    """Return local courses ranked for the current user by the model tiles.
+
+    Only the model's grid cells within 100 miles of the location are scored,
+    and only the course documents that are ranked are read from mongo.
+
+    Args:
+        loc (dict): Dictionary containing latitude and longitude for the center
+            of the desired sphere.
+    Returns:
+        courses (list of dicts): List of the local course documents sorted by
+            predicted rating.
+
+    """
+    course_ids, _ = APP.config['MODEL'].recommend_local(
+        current_user.user_id,
+        loc['Lat'],
+        loc['Lng'],
+        radius_miles=100,
+        exclude=APP.config['CLOSED']
+    )
+    regex = re.compile('^private.*|.*private$', re.IGNORECASE)
+    query = {
+        'Type': {'$regex': regex},
+        'Course Id': {'$in': course_ids.tolist()}
+    }
+    found = {
+        course['Course Id']: course
+        for course in APP.config['COURSES_COLLECTION'].find(query)
+    }
+    courses = [found[idx] for idx in course_ids if idx in found]
+    return courses
+
+
 def get_local_courses(loc):
     """Return list of local public courses.
 
@@ -187,16 +225,21 @@ def get_recommendations(location):
             values.
 
     """
-    recs = APP.config['MODEL'].predict_all(current_user.user_id)
-    recs = np.ma.masked_array(recs, mask=np.zeros(recs.size))
-    sorted_recs = recs.argsort()[::-1]
-    # TODO(me): Store local recs in user object, reduce calls to predict_all().
     # TODO(me): Store local recs in database.
-    local_courses = np.array(get_local_courses(location))
-    public_ids = [course['Course Id'] for course in local_courses]
-    public_ids = np.array(public_ids)
+    if APP.config['MODEL'].tiles_ is not None:
+        courses = get_local_ranked(location)
+    else:
+        local_courses = np.array(get_local_courses(location))
+        public_ids = [course['Course Id'] for course in local_courses]
+        public_ids = np.array(public_ids)
+        sorted_recs, _ = APP.config['MODEL'].recommend(
+            current_user.user_id,
+            k=None,
+            exclude=APP.config['CLOSED'],
+            items=public_ids
+        )
+        courses = local_courses[get_sorted_index(public_ids, sorted_recs)]
     course_links = []
-    courses = local_courses[get_sorted_index(public_ids, sorted_recs)]
     for course in courses:
         name = course['Name']
         locality, region = course['addressLocality'], course['addressRegion']
@@ -283,7 +326,16 @@ def update_reviews():
     reviews.bulk_write(updates)
 
 
-def save_model():
-    """When a new user is added or updated save the file."""
-    with open('model.pkl', 'wb') as model_file:
-        pickle.dump(APP.config['MODEL'], model_file)
+def log_model_update(op, *args):
+    """Record a change made to the model in the review log.
+
+    The log is folded into the stored model in the background, so recording
+    a change costs the same however large the model is.
+
+    Args:
+        op (string): The model method that was called, 'add_user' or
+            'update_user'.
+        *args: The arguments it was called with.
+
+    """
+    APP.config['REVIEW_LOG'].append(op, *args)
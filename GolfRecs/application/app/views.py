@@ -13,7 +13,7 @@ from .forms import (LoginForm, RegistrationForm, ReviewForm, UpdateProfileForm,
                     RecommendationForm)
 from .user import User
 from .utils import (do_review, do_update, check_location, get_next_sequence,
-                    get_recommendations, get_user, save_model)
+                    get_recommendations, get_user, log_model_update)
 
 
 @APP.route('/', methods=['GET'])
@@ -92,8 +92,8 @@ def signup():
         user = User(user_doc)
         login_user(user)
         APP.config['MODEL'].add_user(user_doc['User Id'])
+        log_model_update('add_user', user_doc['User Id'])
         flash('Thanks for registering!')
-        save_model()
         return redirect(url_for('account'))
     else:
         error = form.errors
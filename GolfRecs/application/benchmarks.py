@@ -0,0 +1,279 @@
+"""
+Benchmarks for the ALS implementation.
+
+Each benchmark builds a synthetic ratings matrix shaped like the GolfAdvisor
+reviews, a few very popular courses and many users with one or two reviews,
+and prints its timings. Run a benchmark from the application directory with
+
+    python benchmarks.py <name> [--users N] [--items N] [--ratings N]
+"""
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from als import ALS, BACKENDS, RatingsData
+from ccd import CCD
+
+
+def make_ratings(n_users, n_items, n_ratings, seed=0):
+    """Create a random skewed ratings matrix with 1 to 5 star ratings.
+
+    Args:
+        n_users (int): The number of users (rows).
+        n_items (int): The number of items (columns).
+        n_ratings (int): The number of ratings to draw before repeated user,
+            item pairs are removed.
+        seed (int, default=0): Seed for the random number generator.
+    Returns:
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+
+    """
+    rand = np.random.RandomState(seed)
+    popularity = 1 / np.arange(1, n_items + 1) ** 1.1
+    activity = 1 / np.arange(1, n_users + 1) ** 0.8
+    items = rand.choice(n_items, n_ratings, p=popularity / popularity.sum())
+    users = rand.choice(n_users, n_ratings, p=activity / activity.sum())
+    users, items = np.divmod(np.unique(users * n_items + items), n_items)
+    stars = rand.randint(1, 6, users.size).astype(float)
+    ratings = csr_matrix((stars, (users, items)), shape=(n_users, n_items))
+    return ratings
+
+
+def best_time(func, repeats=3):
+    """Return the best wall time in seconds of several calls to func.
+
+    Args:
+        func (callable): Function taking no arguments.
+        repeats (int, default=3): The number of times to call func.
+    Returns:
+        seconds (float): The fastest of the calls.
+
+    """
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def bench_ratings_cache(ratings):
+    """Compare rebuilding ratings formats each iteration with RatingsData.
+
+    Before RatingsData every iteration of ALS.fit converted the ratings to
+    CSC three times and recomputed the nonzero coordinates for the error.
+
+    Args:
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+
+    """
+    def rebuild():
+        for _ in range(3):
+            ratings.tocsc()
+        ratings.nonzero()
+
+    build = best_time(lambda: RatingsData(ratings))
+    data = RatingsData(ratings)
+    reuse = best_time(lambda: (data.csc, data.rows, data.cols))
+    per_iter = best_time(rebuild)
+    print('RatingsData build (once per fit): {:.4f}s'.format(build))
+    print('Rebuilt formats per iteration:    {:.4f}s'.format(per_iter))
+    print('Cached formats per iteration:     {:.6f}s'.format(reuse))
+    print('Saved per iteration:              {:.4f}s'.format(per_iter - reuse))
+
+
+def bench_backends(ratings, rank=10, sizes=(0.05, 0.25, 1.0)):
+    """Compare the wall time of ALS.fit on each backend.
+
+    The fit includes starting the pool, which happens once per fit. Every
+    backend solves exactly the same systems so they run the same number of
+    iterations.
+
+    Args:
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+        rank (int, default=10): The rank of the factorization.
+        sizes (tuple, default=(0.05, 0.25, 1.0)): Fractions of the users to
+            fit on.
+
+    """
+    print('{:>10} {:>10} '.format('users', 'ratings') + ' '.join(
+        '{:>10}'.format(backend) for backend in BACKENDS
+    ))
+    for size in sizes:
+        subset = ratings[:int(size * ratings.shape[0])]
+        times = []
+        for backend in BACKENDS:
+            model = ALS(rank, tolerance=0.01, seed=0, backend=backend)
+            times.append(best_time(lambda: model.fit(subset), repeats=1))
+        print('{:>10} {:>10} '.format(subset.shape[0], subset.nnz) + ' '.join(
+            '{:>9.2f}s'.format(seconds) for seconds in times
+        ))
+
+
+def bench_mips(ratings, rank=20, k=10, n_queries=500):
+    """Compare recall and latency of the MIPS index with exact scoring.
+
+    Args:
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+        rank (int, default=20): The rank of the factorization.
+        k (int, default=10): The number of items retrieved per user.
+        n_queries (int, default=500): The number of users queried.
+
+    """
+    model = ALS(rank, seed=0, max_iter=5)
+    model.fit(ratings)
+    rated = np.flatnonzero(np.diff(ratings.indptr))
+    users = np.random.RandomState(0).choice(rated, n_queries)
+
+    def exact():
+        return [
+            np.argpartition(-model.predict_all(user), k)[:k] for user in users
+        ]
+
+    truth = exact()
+    exact_time = best_time(exact)
+    build = best_time(model.build_index, repeats=1)
+    print('Index build: {:.3f}s, {} lists'.format(
+        build, model.index_.centroids.shape[0]
+    ))
+    print('{:>8} {:>10} {:>14}'.format(
+        'n_probe', 'recall@' + str(k), 'ms/query'
+    ))
+    print('{:>8} {:>10.3f} {:>14.4f}'.format(
+        'exact', 1.0, 1000 * exact_time / n_queries
+    ))
+    for n_probe in (1, 2, 4, 8, 16, 32):
+        found = [
+            model.recommend_approximate(user, k, n_probe)[0] for user in users
+        ]
+        recall = np.mean([
+            np.intersect1d(fnd, tru).size / k
+            for fnd, tru in zip(found, truth)
+        ])
+        seconds = best_time(lambda: [
+            model.recommend_approximate(user, k, n_probe) for user in users
+        ])
+        print('{:>8} {:>10.3f} {:>14.4f}'.format(
+            n_probe, recall, 1000 * seconds / n_queries
+        ))
+
+
+def fit_trace(model, ratings):
+    """Fit a model and record the training error against wall time.
+
+    Args:
+        model (ALS): The model to fit, with max_iter set.
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+    Returns:
+        trace (list): List of (seconds since the fit started, train_rmse)
+            tuples, one per iteration.
+
+    """
+    trace = []
+    start = perf_counter()
+
+    def record(info):
+        trace.append((perf_counter() - start, info['train_rmse']))
+
+    model.fit(ratings, callback=record)
+    return trace
+
+
+def bench_ccd(ratings, ranks=(10, 50, 100), max_iter=10):
+    """Compare the time ALS and CCD++ take to reach the same training error.
+
+    Both engines minimize the same objective. The target is the worse of the
+    two final errors, so both reach it, and each engine is charged the wall
+    time of the first iteration at or below it.
+
+    Args:
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+        ranks (tuple, default=(10, 50, 100)): The ranks to compare.
+        max_iter (int, default=10): The iterations each engine runs.
+
+    """
+    print('{:>6} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+        'rank', 'target', 'als', 'ccd', 'als/iter', 'ccd/iter'
+    ))
+    for rank in ranks:
+        traces = [
+            fit_trace(ALS(rank, seed=0, tolerance=0, max_iter=max_iter),
+                      ratings),
+            fit_trace(CCD(rank, seed=0, tolerance=0, max_iter=max_iter),
+                      ratings)
+        ]
+        target = max(trace[-1][1] for trace in traces)
+        reached = [
+            next(seconds for seconds, rmse in trace if rmse <= target)
+            for trace in traces
+        ]
+        print('{:>6} {:>8.4f} {:>9.2f}s {:>9.2f}s {:>9.2f}s {:>9.2f}s'.format(
+            rank, target, reached[0], reached[1],
+            traces[0][-1][0] / len(traces[0]),
+            traces[1][-1][0] / len(traces[1])
+        ))
+
+
+def bench_dtype(ratings, rank=50, max_iter=5, n_queries=2000):
+    """Compare memory, throughput and accuracy of float64 and float32 models.
+
+    Args:
+        ratings (scipy.sparse.csr_matrix): Ratings matrix of users x items.
+        rank (int, default=50): The rank of the factorization.
+        max_iter (int, default=5): The iterations of each fit.
+        n_queries (int, default=2000): The number of users recommended to.
+
+    """
+    data = RatingsData(ratings)
+    wide = ratings.data.nbytes + ratings.indices.nbytes
+    compact = data.csr.data.nbytes + data.csr.indices.nbytes
+    print('Ratings values and indices: {:.1f}MB as {}/{}, {:.1f}MB as {}/{}'
+          .format(wide / 2 ** 20, ratings.data.dtype, ratings.indices.dtype,
+                  compact / 2 ** 20, data.csr.data.dtype,
+                  data.csr.indices.dtype))
+    users = np.random.RandomState(0).choice(ratings.shape[0], n_queries)
+    print('{:>8} {:>10} {:>8} {:>12} {:>14} {:>10}'.format(
+        'dtype', 'features', 'fit', 'predict/s', 'recommend/s', 'rmse'
+    ))
+    for dtype in ('float64', 'float32'):
+        model = ALS(rank, seed=0, tolerance=0, max_iter=max_iter, dtype=dtype)
+        fit = best_time(lambda: model.fit(ratings), repeats=1)
+        feats = model.user_feats.nbytes + model.item_feats.nbytes
+        predict = best_time(
+            lambda: model.predict_pairs(data.rows, data.cols)
+        )
+        recommend = best_time(lambda: model.recommend(users, k=10))
+        print('{:>8} {:>8.1f}MB {:>7.2f}s {:>12.3g} {:>14.3g} {:>10.5f}'
+              .format(dtype, feats / 2 ** 20, fit, data.nnz / predict,
+                      n_queries / recommend, model.score(ratings)))
+
+
+BENCHMARKS = {
+    'backends': bench_backends,
+    'ccd': bench_ccd,
+    'dtype': bench_dtype,
+    'mips': bench_mips,
+    'ratings_cache': bench_ratings_cache,
+}
+
+
+def main():
+    """Parse the command line and run the requested benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=30000)
+    parser.add_argument('--ratings', type=int, default=500000)
+    args = parser.parse_args()
+    ratings = make_ratings(args.users, args.items, args.ratings)
+    print('{} ratings, {} users, {} items'.format(
+        ratings.nnz, ratings.shape[0], ratings.shape[1]
+    ))
+    BENCHMARKS[args.name](ratings)
+
+
+if __name__ == '__main__':
+    main()
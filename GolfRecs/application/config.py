@@ -1,12 +1,15 @@
 """Configuration settings for GoflRecs app."""
 
 from concurrent.futures import ThreadPoolExecutor
+from os import path
 import pickle
 from string import punctuation
 
 from pymongo import MongoClient
 import yaml
 
+import model_store
+
 # Setup app
 with open('secrets.yaml', 'r') as secrets_file:
     SECRETS = yaml.load(secrets_file)
@@ -42,6 +45,29 @@ CLOSED = []
 for course in COURSES_COLLECTION.find({'Closed': True}):
     CLOSED.append(course['Course Id'])
 
-# Load recommendation model
-with open('model.pkl', 'rb') as model:
-    MODEL = pickle.load(model)
+
+def tile_courses(model):
+    """Tile all courses that have a location for local recommendations."""
+    located = list(COURSES_COLLECTION.find(
+        {'location': {'$exists': True}},
+        {'Course Id': 1, 'location': 1}
+    ))
+    model.set_locations(
+        [course['Course Id'] for course in located],
+        [course['location']['coordinates'][1] for course in located],
+        [course['location']['coordinates'][0] for course in located]
+    )
+
+
+# Load recommendation model and replay reviews logged since its snapshot
+MODEL_DIR = 'model'
+REVIEW_LOG = model_store.ReviewLog(path.join(MODEL_DIR, 'reviews.log'))
+MODEL = model_store.open_model(
+    MODEL_DIR,
+    REVIEW_LOG,
+    legacy='model.pkl',
+    prepare=tile_courses
+)
+if MODEL.tiles_ is None:
+    tile_courses(MODEL)
+COMPACTOR = model_store.start_compactor(MODEL_DIR, REVIEW_LOG)
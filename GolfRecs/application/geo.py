@@ -0,0 +1,215 @@
+"""
+Geographic tiling of item features for local recommendations.
+
+Most recommendation requests only care about courses within a hundred miles
+or so of a location. Scoring every course in the world and then discarding
+all but the nearby ones wastes almost all of the work, so the courses are
+bucketed into a grid of latitude and longitude cells. Each cell keeps its
+course ids, coordinates and a contiguous copy of their feature columns, and a
+query scores only the cells its radius touches.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 2 * np.pi * EARTH_RADIUS_MILES / 360
+
+
+def haversine_miles(lat, lng, lats, lngs):
+    """Return the great circle distance in miles from one point to many.
+
+    Args:
+        lat (float): Latitude of the origin in degrees.
+        lng (float): Longitude of the origin in degrees.
+        lats (np.ndarray): Latitudes of the destinations in degrees.
+        lngs (np.ndarray): Longitudes of the destinations in degrees.
+    Returns:
+        miles (np.ndarray): Array with the distance to each destination.
+
+    """
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    hav = np.sin((lats - lat) / 2) ** 2\
+        + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    miles = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(hav, 1)))
+    return miles
+
+
+class GeoTiles(object):
+    """Grid of latitude and longitude cells holding item features.
+
+    The items are stored ordered by cell so that the ids, coordinates and
+    features of every cell are contiguous slices delimited by cell_ptr.
+
+    Attributes:
+        cell_deg (float): The size of a cell in degrees.
+        cells (dict): Dictionary of (row, col) cell keys to the position of
+            the cell in cell_ptr.
+        cell_ptr (np.ndarray): Array of offsets delimiting each cell.
+        ids (np.ndarray): The item ids ordered by cell.
+        lats (np.ndarray): The item latitudes ordered by cell.
+        lngs (np.ndarray): The item longitudes ordered by cell.
+        feats (np.ndarray): Contiguous array of shape rank x items with the
+            item features ordered by cell.
+
+    """
+
+    def __init__(self, cell_deg=1.0):
+        """Create an empty grid with cells of the given size.
+
+        Args:
+            cell_deg (float, default=1.0): The size of a cell in degrees.
+
+        """
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.cell_ptr = None
+        self.ids = None
+        self.lats = None
+        self.lngs = None
+        self.feats = None
+
+    @property
+    def n_cols(self):
+        """Return the number of cells around a circle of latitude."""
+        return int(np.ceil(360 / self.cell_deg))
+
+    def _keys(self, lats, lngs):
+        """Return the cell row and column for each coordinate."""
+        rows = np.floor((np.asarray(lats) + 90) / self.cell_deg).astype(int)
+        cols = np.floor((np.asarray(lngs) + 180) / self.cell_deg)\
+            .astype(int) % self.n_cols
+        return rows, cols
+
+    def build(self, ids, lats, lngs, item_feats):
+        """Bucket the items into cells and copy their features.
+
+        Args:
+            ids (np.ndarray): The item ids that have a location.
+            lats (np.ndarray): The latitude of each item in degrees.
+            lngs (np.ndarray): The longitude of each item in degrees.
+            item_feats (np.ndarray): Array of shape rank x items with the
+                features of all items, indexed by item id.
+        Returns:
+            self (GeoTiles): The built grid.
+
+        """
+        ids = np.asarray(ids, dtype=int)
+        lats, lngs = np.asarray(lats, float), np.asarray(lngs, float)
+        rows, cols = self._keys(lats, lngs)
+        order = np.argsort(rows * self.n_cols + cols, kind='stable')
+        self.ids = ids[order]
+        self.lats = lats[order]
+        self.lngs = lngs[order]
+        self.feats = np.ascontiguousarray(item_feats[:, self.ids])
+        self._index_cells()
+        return self
+
+    @classmethod
+    def restore(cls, cell_deg, ids, lats, lngs, feats):
+        """Recreate a grid from the arrays of a previously built one.
+
+        The arrays are used as they are, so memory mapped arrays stay mapped.
+
+        Args:
+            cell_deg (float): The size of a cell in degrees.
+            ids (np.ndarray): The item ids ordered by cell.
+            lats (np.ndarray): The item latitudes ordered by cell.
+            lngs (np.ndarray): The item longitudes ordered by cell.
+            feats (np.ndarray): The item features ordered by cell.
+        Returns:
+            tiles (GeoTiles): The restored grid.
+
+        """
+        tiles = cls(cell_deg)
+        tiles.ids, tiles.lats, tiles.lngs = ids, lats, lngs
+        tiles.feats = feats
+        tiles._index_cells()
+        return tiles
+
+    def _index_cells(self):
+        """Find the cell offsets of the items, which are ordered by cell."""
+        rows, cols = self._keys(self.lats, self.lngs)
+        keys = rows * self.n_cols + cols
+        uniq, starts = np.unique(keys, return_index=True)
+        self.cell_ptr = np.concatenate((starts, [keys.size]))
+        self.cells = {
+            (key // self.n_cols, key % self.n_cols): pos
+            for pos, key in enumerate(uniq)
+        }
+
+    def refresh(self, item_feats):
+        """Copy new features for the same items, for use after a refit.
+
+        Args:
+            item_feats (np.ndarray): Array of shape rank x items.
+
+        """
+        self.feats = np.ascontiguousarray(item_feats[:, self.ids])
+
+    def covering_cells(self, lat, lng, radius_miles):
+        """Return the slices of the cells that a circle touches.
+
+        Args:
+            lat (float): Latitude of the center in degrees.
+            lng (float): Longitude of the center in degrees.
+            radius_miles (float): Radius of the circle in miles.
+        Returns:
+            spans (list): List of (start, stop) offsets of the touched cells
+                that contain items.
+
+        """
+        lat_deg = radius_miles / MILES_PER_DEGREE
+        row_lo, _ = self._keys(max(lat - lat_deg, -90), 0)
+        row_hi, _ = self._keys(min(lat + lat_deg, 90), 0)
+        widest = max(abs(lat) + lat_deg, 0)
+        if widest >= 90:
+            cols = range(self.n_cols)
+        else:
+            lng_deg = lat_deg / np.cos(np.radians(widest))
+            _, col_lo = self._keys(0, lng - lng_deg)
+            n_span = int(np.ceil(2 * lng_deg / self.cell_deg)) + 1
+            cols = sorted({
+                (col_lo + step) % self.n_cols
+                for step in range(min(n_span, self.n_cols))
+            })
+        spans = []
+        for row in range(row_lo, row_hi + 1):
+            for col in cols:
+                pos = self.cells.get((row, col))
+                if pos is not None:
+                    spans.append((self.cell_ptr[pos], self.cell_ptr[pos + 1]))
+        return spans
+
+    def score(self, user_vec, lat, lng, radius_miles):
+        """Score the items within a radius of a location.
+
+        Only the cells the radius touches are scored, each with a small
+        matrix vector product over its contiguous features. Items in those
+        cells that are further than the radius are dropped afterwards.
+
+        Args:
+            user_vec (np.ndarray): A user feature vector of length rank.
+            lat (float): Latitude of the center in degrees.
+            lng (float): Longitude of the center in degrees.
+            radius_miles (float): Radius of the search in miles.
+        Returns:
+            ids (np.ndarray): The ids of the items within the radius.
+            scores (np.ndarray): The predicted rating of each item.
+
+        """
+        spans = self.covering_cells(lat, lng, radius_miles)
+        if not spans:
+            return np.array([], dtype=int), np.array([])
+        ids = np.concatenate([self.ids[start:stop] for start, stop in spans])
+        scores = np.concatenate([
+            user_vec.dot(self.feats[:, start:stop]) for start, stop in spans
+        ])
+        miles = haversine_miles(
+            lat,
+            lng,
+            np.concatenate([self.lats[start:stop] for start, stop in spans]),
+            np.concatenate([self.lngs[start:stop] for start, stop in spans])
+        )
+        inside = miles <= radius_miles
+        return ids[inside], scores[inside]
@@ -0,0 +1,142 @@
+"""
+Approximate maximum inner product search over item features.
+
+Finding the items with the largest predicted rating for a user is a maximum
+inner product search (MIPS) over the columns of the item features. Following
+Bachrach et al., Speeding Up the Xbox Recommender System Using a Euclidean
+Transformation for Inner-Product Spaces, every item vector y is augmented with
+sqrt(M^2 - |y|^2), where M is the largest item norm, and every query with a
+zero. The nearest augmented item to an augmented query is then the item with
+the largest inner product, so an ordinary nearest neighbour structure can be
+used. This module clusters the augmented items with k-means into an inverted
+file (IVF) and answers a query by scoring only the items in the n_probe
+clusters closest to it.
+"""
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+
+class MIPSIndex(object):
+    """Inverted file index for approximate top-k inner product search.
+
+    Attributes:
+        n_lists (int or None): The number of clusters, the square root of the
+            number of items when None.
+        n_probe (int): The default number of clusters scored per query. More
+            clusters give higher recall at the cost of latency.
+        centroids (np.ndarray): Array of shape n_lists x rank + 1 with the
+            centroids of the augmented items.
+        list_ptr (np.ndarray): Array of n_lists + 1 offsets delimiting each
+            cluster in ids and feats.
+        ids (np.ndarray): The item ids ordered by cluster.
+        feats (np.ndarray): Contiguous array of shape rank x items with the
+            item features ordered by cluster.
+
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, seed=None):
+        """Create an empty index with the given parameters.
+
+        Args:
+            n_lists (int, default=None): The number of clusters, the square
+                root of the number of items when None.
+            n_probe (int, default=8): The default number of clusters scored
+                per query.
+            seed (int, default=None): Seed for the k-means initialization.
+
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = None
+        self.list_ptr = None
+        self.ids = None
+        self.feats = None
+
+    @staticmethod
+    def augment_items(item_feats):
+        """Apply the Euclidean transformation to the item features.
+
+        Args:
+            item_feats (np.ndarray): Array of shape rank x items.
+        Returns:
+            augmented (np.ndarray): Array of shape items x rank + 1 whose rows
+                all have the norm of the largest item.
+
+        """
+        norms = np.einsum('ij,ij->j', item_feats, item_feats)
+        extra = np.sqrt(np.maximum(norms.max() - norms, 0))
+        augmented = np.vstack((item_feats, extra)).T
+        return augmented
+
+    def build(self, item_feats):
+        """Cluster the items and lay their features out by cluster.
+
+        Args:
+            item_feats (np.ndarray): Array of shape rank x items.
+        Returns:
+            self (MIPSIndex): The built index.
+
+        """
+        augmented = self.augment_items(item_feats)
+        n_items = augmented.shape[0]
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_items)))
+        n_lists = min(n_lists, n_items)
+        kmeans = KMeans(n_lists, n_init=1, random_state=self.seed)
+        labels = kmeans.fit_predict(augmented)
+        self.centroids = kmeans.cluster_centers_
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=n_lists)
+        self.list_ptr = np.concatenate(([0], np.cumsum(counts)))
+        self.ids = order
+        self.feats = np.ascontiguousarray(item_feats[:, order])
+        return self
+
+    def search(self, queries, k=10, n_probe=None):
+        """Return the approximate top k items for each query vector.
+
+        Args:
+            queries (np.ndarray): A user feature vector of length rank or an
+                array of shape rank x queries.
+            k (int, default=10): The number of items to return per query.
+            n_probe (int, default=None): The number of clusters to score,
+                self.n_probe when None.
+        Returns:
+            ids (np.ndarray): Array of shape k, or queries x k, with the item
+                ids best first, padded with -1 if the probed clusters hold
+                fewer than k items.
+            scores (np.ndarray): Array of the inner products aligned with ids,
+                padded with -inf.
+
+        """
+        if self.centroids is None:
+            raise Exception('The index must be built before searching.')
+        single = np.ndim(queries) == 1
+        queries = np.asarray(queries).reshape(self.feats.shape[0], -1)
+        n_probe = min(n_probe or self.n_probe, self.centroids.shape[0])
+        # The query's augmented coordinate is zero so only the first rank
+        # coordinates of the centroids take part in the inner product.
+        dists = np.einsum('ij,ij->i', self.centroids, self.centroids)\
+            - 2 * queries.T.dot(self.centroids[:, :-1].T)
+        probes = np.argpartition(dists, n_probe - 1, axis=1)[:, :n_probe]
+        ids = np.full((queries.shape[1], k), -1)
+        scores = np.full((queries.shape[1], k), -np.inf)
+        for row, lists in enumerate(probes):
+            spans = [
+                np.arange(self.list_ptr[lst], self.list_ptr[lst + 1])
+                for lst in lists
+            ]
+            cand = np.concatenate(spans)
+            cand_scores = queries[:, row].dot(self.feats[:, cand])
+            top = min(k, cand.size)
+            if top < cand.size:
+                best = np.argpartition(-cand_scores, top - 1)[:top]
+            else:
+                best = np.arange(cand.size)
+            best = best[np.argsort(-cand_scores[best], kind='stable')]
+            ids[row, :top] = self.ids[cand[best]]
+            scores[row, :top] = cand_scores[best]
+        if single:
+            return ids[0], scores[0]
+        return ids, scores
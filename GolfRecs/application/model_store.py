@@ -0,0 +1,614 @@
+"""
+Pickle free on disk format for ALS models.
+
+A model is stored as a directory holding one raw .npy file per array, the
+feature matrices, the CSR arrays of the ratings and those of the optional
+geographic tiles and MIPS index, plus a small JSON header with the format
+version, the model class and parameters and a SHA-256 checksum of every
+array file.
+
+Loading maps the arrays with np.load(mmap_mode=...) rather than reading them,
+so a web worker starts almost instantly and all workers on a machine share
+the same pages of the OS page cache. The default copy-on-write mode still
+lets a worker update its own model, with only the pages it touches copied.
+
+Saving writes the array files under fresh names and then atomically replaces
+the header, so a reader always sees either the old or the new model in full.
+The array files of the previous snapshot are only deleted by the save after
+it, so a reader that has just read the old header can still map them.
+
+Between snapshots every mutation of a served model, a new user or a new
+rating, is appended as one JSON line to a ReviewLog. Appending is O(1) no
+matter how large the model is, and any number of processes may append at
+once. A background compactor periodically seals the log, folds the sealed
+segments into a new snapshot and deletes them, and a process that starts
+up replays whatever the latest snapshot has not folded in yet.
+"""
+
+import fcntl
+from glob import glob
+from hashlib import sha256
+import json
+import pickle
+from os import (O_APPEND, O_CREAT, O_WRONLY, close, getpid, listdir,
+                makedirs, open as os_open, path, remove, rename, replace,
+                write)
+from threading import Event, Thread
+from uuid import uuid4
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from als import ALS, ImplicitALS, compact_values
+from ccd import CCD
+from geo import GeoTiles
+from mips import MIPSIndex
+
+FORMAT = 'golfrecs-als'
+VERSION = 1
+HEADER = 'header.json'
+PARAMS = (
+    'rank', 'lambda_', 'tolerance', 'max_block_bytes', 'rmse_sample',
+    'backend', 'n_workers', 'blas_threads', 'ordering', 'max_iter', 'patience',
+    'pending_threshold', 'biased', 'bias_lambda', 'solver', 'cg_steps',
+    'dtype'
+)
+MODELS = {
+    'ALS': ALS,
+    'CCD': CCD,
+    'ImplicitALS': ImplicitALS
+}
+MODEL_PARAMS = {
+    'CCD': ('inner_iter',),
+    'ImplicitALS': ('alpha',)
+}
+
+
+class ModelFormatError(Exception):
+    """Raised when a stored model is unreadable, corrupt or incompatible."""
+
+
+def checksum(file_path):
+    """Return the SHA-256 hex digest of a file.
+
+    Args:
+        file_path (string): Path of the file.
+    Returns:
+        digest (string): The hex digest of the file's contents.
+
+    """
+    digest = sha256()
+    with open(file_path, 'rb') as array_file:
+        for chunk in iter(lambda: array_file.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_arrays(model):
+    """Collect the arrays of a model that are stored on disk.
+
+    Any pending ratings of the model are merged into its ratings first, and
+    the rating values are stored with compact_values.
+
+    Args:
+        model (als.ALS): A fit model.
+    Returns:
+        arrays (dict): Dictionary of array name to np.ndarray.
+
+    """
+    model.merge_pending()
+    ratings = csr_matrix(model.ratings)
+    arrays = {
+        'user_feats': model.user_feats,
+        'item_feats': model.item_feats,
+        'ratings_indptr': ratings.indptr,
+        'ratings_indices': ratings.indices,
+        'ratings_data': compact_values(ratings.data)
+    }
+    if model.biased:
+        arrays['user_bias'] = model.user_bias
+        arrays['item_bias'] = model.item_bias
+    if model.tiles_ is not None:
+        for name in ('ids', 'lats', 'lngs', 'feats'):
+            arrays['tiles_' + name] = getattr(model.tiles_, name)
+    if model.index_ is not None:
+        for name in ('centroids', 'list_ptr', 'ids', 'feats'):
+            arrays['index_' + name] = getattr(model.index_, name)
+    return arrays
+
+
+def save_model(model, model_dir, log_folded=0):
+    """Write a model to a directory in the versioned array format.
+
+    Args:
+        model (als.ALS): A fit model.
+        model_dir (string): Path of the directory, created if missing.
+        log_folded (int, default=0): The number of the last ReviewLog segment
+            whose records the model includes.
+
+    """
+    makedirs(model_dir, exist_ok=True)
+    previous = set()
+    if path.exists(path.join(model_dir, HEADER)):
+        try:
+            previous = {
+                entry['file']
+                for entry in read_header(model_dir)['arrays'].values()
+            }
+        except ModelFormatError:
+            pass
+    token = uuid4().hex[:12]
+    header = {
+        'format': FORMAT,
+        'version': VERSION,
+        'model': type(model).__name__,
+        'params': {
+            name: getattr(model, name)
+            for name in PARAMS + MODEL_PARAMS.get(type(model).__name__, ())
+        },
+        'shape': list(model.ratings.shape),
+        'global_mean': model.global_mean,
+        'log_folded': log_folded,
+        'tiles': None,
+        'index': None,
+        'arrays': {}
+    }
+    if model.tiles_ is not None:
+        header['tiles'] = {'cell_deg': model.tiles_.cell_deg}
+    if model.index_ is not None:
+        header['index'] = {
+            'n_lists': model.index_.n_lists,
+            'n_probe': model.index_.n_probe,
+            'seed': model.index_.seed
+        }
+    for name, array in model_arrays(model).items():
+        file_name = '{}.{}.npy'.format(name, token)
+        file_path = path.join(model_dir, file_name)
+        np.save(file_path, np.ascontiguousarray(array))
+        header['arrays'][name] = {
+            'file': file_name,
+            'dtype': np.asarray(array).dtype.str,
+            'shape': list(np.shape(array)),
+            'sha256': checksum(file_path)
+        }
+    temp = path.join(model_dir, '{}.{}.tmp'.format(HEADER, getpid()))
+    with open(temp, 'w') as header_file:
+        json.dump(header, header_file, indent=2)
+    replace(temp, path.join(model_dir, HEADER))
+    keep = previous | {entry['file'] for entry in header['arrays'].values()}
+    for file_name in listdir(model_dir):
+        if file_name.endswith('.npy') and file_name not in keep:
+            remove(path.join(model_dir, file_name))
+
+
+def read_header(model_dir):
+    """Read and check the header of a stored model.
+
+    Args:
+        model_dir (string): Path of the model directory.
+    Returns:
+        header (dict): The parsed header.
+
+    """
+    try:
+        with open(path.join(model_dir, HEADER)) as header_file:
+            header = json.load(header_file)
+    except (OSError, ValueError) as error:
+        raise ModelFormatError(
+            'Cannot read model header in {}: {}'.format(model_dir, error)
+        )
+    if header.get('format') != FORMAT or header.get('version') != VERSION:
+        raise ModelFormatError(
+            'Unsupported model format {} version {} in {}.'
+            .format(header.get('format'), header.get('version'), model_dir)
+        )
+    return header
+
+
+def validate_model(model_dir, header=None):
+    """Check every array file of a stored model against its checksum.
+
+    Args:
+        model_dir (string): Path of the model directory.
+        header (dict, default=None): A header already read with read_header,
+            read from the directory when None.
+
+    """
+    if header is None:
+        header = read_header(model_dir)
+    for name, entry in header['arrays'].items():
+        if checksum(path.join(model_dir, entry['file'])) != entry['sha256']:
+            raise ModelFormatError(
+                'Checksum mismatch for {} in {}.'.format(name, model_dir)
+            )
+
+
+def load_model(model_dir, mmap_mode='c', verify=False, header=None):
+    """Load a stored model with its arrays memory mapped.
+
+    Args:
+        model_dir (string): Path of the model directory.
+        mmap_mode (string or None, default='c'): Passed to np.load. 'c' maps
+            the arrays copy-on-write so the model can still be updated, 'r'
+            maps them read only and None reads them into private memory.
+        verify (bool, default=False): Whether to check every array against
+            its checksum first, which reads all of the files once.
+        header (dict, default=None): A header already read with read_header,
+            read from the directory when None. Passing it lets the caller use
+            the same snapshot's log_folded.
+    Returns:
+        model (als.ALS): The loaded model.
+
+    """
+    if header is None:
+        header = read_header(model_dir)
+    if verify:
+        validate_model(model_dir, header)
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        array = np.load(
+            path.join(model_dir, entry['file']),
+            mmap_mode=mmap_mode,
+            allow_pickle=False
+        )
+        if array.dtype.str != entry['dtype'] or \
+                list(array.shape) != entry['shape']:
+            raise ModelFormatError(
+                'Array {} in {} does not match the header.'
+                .format(name, model_dir)
+            )
+        arrays[name] = array
+    model_cls = MODELS.get(header.get('model', 'ALS'))
+    if model_cls is None:
+        raise ModelFormatError(
+            'Unknown model class {} in {}.'.format(header['model'], model_dir)
+        )
+    model = model_cls(**header['params'])
+    model.user_feats = arrays['user_feats']
+    model.item_feats = arrays['item_feats']
+    if model.biased:
+        model.global_mean = header['global_mean']
+        model.user_bias = arrays['user_bias']
+        model.item_bias = arrays['item_bias']
+    model.ratings = csr_matrix(
+        (
+            arrays['ratings_data'],
+            arrays['ratings_indices'],
+            arrays['ratings_indptr']
+        ),
+        shape=tuple(header['shape']),
+        copy=False
+    )
+    if header['tiles'] is not None:
+        model.tiles_ = GeoTiles.restore(
+            header['tiles']['cell_deg'],
+            arrays['tiles_ids'],
+            arrays['tiles_lats'],
+            arrays['tiles_lngs'],
+            arrays['tiles_feats']
+        )
+    if header['index'] is not None:
+        index = MIPSIndex(**header['index'])
+        for name in ('centroids', 'list_ptr', 'ids', 'feats'):
+            setattr(index, name, arrays['index_' + name])
+        model.index_ = index
+    return model
+
+
+def log_folded(model_dir, header=None):
+    """Return the last ReviewLog segment folded into a stored model.
+
+    Args:
+        model_dir (string): Path of the model directory.
+        header (dict, default=None): A header already read with read_header,
+            read from the directory when None.
+    Returns:
+        folded (int): The segment number, 0 if none has been folded.
+
+    """
+    if header is None:
+        header = read_header(model_dir)
+    return header.get('log_folded', 0)
+
+
+class ReviewLog(object):
+    """Append-only log of model mutations.
+
+    Records are appended to the active log file with a single O_APPEND write
+    each. Sealing renames the active file to a numbered segment, after which
+    new records start a fresh active file. Writers hold a shared lock while
+    appending and sealing takes an exclusive one, so no record is ever
+    written to a segment after it was sealed.
+
+    Attributes:
+        log_path (string): Path of the active log file.
+
+    """
+
+    OPS = ('add_user', 'update_user')
+
+    def __init__(self, log_path):
+        """Create a log at the given path.
+
+        Args:
+            log_path (string): Path of the active log file. Segments and the
+                lock files are kept next to it.
+
+        """
+        self.log_path = log_path
+
+    def _lock(self, suffix, mode):
+        """Open and lock one of the log's lock files.
+
+        Args:
+            suffix (string): Suffix of the lock file.
+            mode (int): fcntl lock mode.
+        Returns:
+            lock_file (file): The open, locked file. Closing it releases the
+                lock.
+
+        """
+        lock_file = open(self.log_path + suffix, 'a')
+        try:
+            fcntl.flock(lock_file, mode)
+        except OSError:
+            lock_file.close()
+            raise
+        return lock_file
+
+    def append(self, op, *args):
+        """Append a single mutation to the log.
+
+        Args:
+            op (string): The name of the ALS method, 'add_user' or
+                'update_user'.
+            *args: The arguments the method is called with.
+
+        """
+        if op not in self.OPS:
+            raise ValueError('Unknown model operation {!r}.'.format(op))
+        line = json.dumps(
+            {'op': op, 'args': args},
+            default=lambda value: value.item()
+        ) + '\n'
+        with self._lock('.lock', fcntl.LOCK_SH):
+            log_fd = os_open(self.log_path, O_WRONLY | O_APPEND | O_CREAT)
+            try:
+                write(log_fd, line.encode())
+            finally:
+                close(log_fd)
+
+    def segments(self):
+        """Return the sealed segments of the log in order.
+
+        Returns:
+            segments (list): List of (number, path) tuples.
+
+        """
+        segments = []
+        for seg_path in glob(self.log_path + '.*'):
+            suffix = seg_path[len(self.log_path) + 1:]
+            if suffix.isdigit():
+                segments.append((int(suffix), seg_path))
+        return sorted(segments)
+
+    def seal(self, folded=0):
+        """Seal the active log into the next numbered segment.
+
+        Args:
+            folded (int, default=0): The last segment already folded into the
+                snapshot, so that numbers keep increasing after segments are
+                deleted.
+        Returns:
+            number (int or None): The number of the new segment or None if the
+                active log was empty.
+
+        """
+        with self._lock('.lock', fcntl.LOCK_EX):
+            if not path.exists(self.log_path) or \
+                    path.getsize(self.log_path) == 0:
+                return None
+            numbers = [number for number, _ in self.segments()]
+            number = max(numbers + [folded]) + 1
+            rename(self.log_path, '{}.{}'.format(self.log_path, number))
+        return number
+
+    @staticmethod
+    def records(log_path):
+        """Yield the complete records of a log file.
+
+        A trailing line without a newline, left by a crash mid-write, is
+        ignored.
+
+        Args:
+            log_path (string): Path of the active log or of a segment.
+        Yields:
+            record (dict): Dictionary with the 'op' and its 'args'.
+
+        """
+        if not path.exists(log_path):
+            return
+        with open(log_path) as log_file:
+            for line in log_file:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+
+    @staticmethod
+    def apply(model, records):
+        """Apply records to a model.
+
+        Args:
+            model (als.ALS): The model to update.
+            records (iterable): Records as yielded by records.
+        Returns:
+            count (int): The number of records applied.
+
+        """
+        count = 0
+        for record in records:
+            getattr(model, record['op'])(*record['args'])
+            count += 1
+        return count
+
+    def replay(self, model, folded=0):
+        """Apply every record the snapshot has not folded in to a model.
+
+        The shared append lock is held throughout, so the active log cannot
+        be sealed between reading the segments and reading the active log.
+
+        Args:
+            model (als.ALS): A model loaded from the snapshot.
+            folded (int, default=0): The last segment folded into the
+                snapshot, as returned by log_folded.
+        Returns:
+            count (int): The number of records applied.
+
+        """
+        count = 0
+        with self._lock('.lock', fcntl.LOCK_SH):
+            for number, seg_path in self.segments():
+                if number > folded:
+                    count += self.apply(model, self.records(seg_path))
+            count += self.apply(model, self.records(self.log_path))
+        return count
+
+    def compaction_lock(self, block=True):
+        """Take the lock that serializes writers of the stored snapshot.
+
+        Args:
+            block (bool, default=True): Whether to wait for the lock. If False
+                and the lock is held, BlockingIOError is raised.
+        Returns:
+            lock_file (file): The open, locked file. Closing it releases the
+                lock.
+
+        """
+        mode = fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB
+        return self._lock('.compact', mode)
+
+    def compact(self, model_dir):
+        """Fold the log into a new snapshot of the stored model.
+
+        The active log is sealed, the snapshot is loaded into private memory
+        and every unfolded segment is applied to it before it is saved and the
+        folded segments are deleted. Only one process compacts at a time;
+        others return immediately.
+
+        Args:
+            model_dir (string): Path of the model directory.
+        Returns:
+            count (int): The number of records folded in.
+
+        """
+        try:
+            lock = self.compaction_lock(block=False)
+        except BlockingIOError:
+            return 0
+        with lock:
+            header = read_header(model_dir)
+            folded = log_folded(model_dir, header)
+            self.seal(folded)
+            pending = [
+                (number, seg_path) for number, seg_path in self.segments()
+                if number > folded
+            ]
+            if not pending:
+                return 0
+            model = load_model(model_dir, mmap_mode=None, header=header)
+            count = 0
+            for _, seg_path in pending:
+                count += self.apply(model, self.records(seg_path))
+            save_model(model, model_dir, log_folded=pending[-1][0])
+            for number, seg_path in self.segments():
+                if number <= pending[-1][0]:
+                    remove(seg_path)
+        return count
+
+
+def load_legacy(file_path):
+    """Load an ALS model pickled before the array format existed.
+
+    Unpickling restores only the attributes the class had when the model was
+    pickled, so the ratings and features are copied into a freshly
+    constructed ALS that has every attribute of the current class.
+
+    Args:
+        file_path (string): Path of the pickled model.
+    Returns:
+        model (als.ALS): The model with its original parameters.
+
+    """
+    with open(file_path, 'rb') as model_file:
+        legacy = pickle.load(model_file)
+    model = ALS(
+        rank=legacy.rank,
+        lambda_=legacy.lambda_,
+        tolerance=legacy.tolerance
+    )
+    model.rand = legacy.rand
+    model.ratings = legacy.ratings
+    model.user_feats = legacy.user_feats
+    model.item_feats = legacy.item_feats
+    return model
+
+
+def open_model(model_dir, log, legacy=None, prepare=None):
+    """Load the served model and replay the log records it is missing.
+
+    When the directory holds no snapshot yet, one is created from a legacy
+    pickled model first, under the compaction lock so that concurrently
+    starting processes create it only once.
+
+    The header is read once, so the model and the log_folded it is replayed
+    from belong to the same snapshot. A compaction deletes the segments it
+    folded only after replacing the header, so if log_folded has changed by
+    the end of the replay the model is loaded again from the new snapshot.
+
+    Args:
+        model_dir (string): Path of the model directory.
+        log (ReviewLog): The log of mutations since the snapshot.
+        legacy (string, default=None): Path of a pickled model to create the
+            first snapshot from.
+        prepare (callable, default=None): Called with the legacy model before
+            its first snapshot is saved.
+    Returns:
+        model (als.ALS): The up to date model.
+
+    """
+    makedirs(model_dir, exist_ok=True)
+    if legacy is not None and not path.exists(path.join(model_dir, HEADER)):
+        with log.compaction_lock():
+            if not path.exists(path.join(model_dir, HEADER)):
+                model = load_legacy(legacy)
+                if prepare is not None:
+                    prepare(model)
+                save_model(model, model_dir)
+    while True:
+        header = read_header(model_dir)
+        model = load_model(model_dir, header=header)
+        folded = log_folded(model_dir, header)
+        log.replay(model, folded)
+        if log_folded(model_dir) == folded:
+            return model
+
+
+def start_compactor(model_dir, log, interval=600):
+    """Compact the log into the stored model periodically in the background.
+
+    Args:
+        model_dir (string): Path of the model directory.
+        log (ReviewLog): The log to fold in.
+        interval (float, default=600): Seconds between compactions.
+    Returns:
+        stop (threading.Event): Event that stops the compactor when set.
+
+    """
+    stop = Event()
+
+    def run():
+        """Compact until stopped."""
+        while not stop.wait(interval):
+            log.compact(model_dir)
+
+    Thread(target=run, name='model-compactor', daemon=True).start()
+    return stop
@@ -0,0 +1,6 @@
+"""Put the application modules on the import path of the tests."""
+
+from os import path
+import sys
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
@@ -0,0 +1,43 @@
+"""Tests for fitting ALS models."""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from als import ALS
+
+
+def random_ratings(n_users=200, n_items=40, density=0.2, seed=0):
+    """Return a random sparse matrix of 1 to 5 star ratings."""
+    rand = np.random.RandomState(seed)
+    stars = rand.randint(1, 6, (n_users, n_items))
+    return csr_matrix(stars * (rand.rand(n_users, n_items) < density))
+
+
+def test_callback_sees_the_iteration_that_stops_early():
+    train, validation = random_ratings(), random_ratings(seed=1)
+    seen = []
+    model = ALS(5, lambda_=0.01, seed=0, tolerance=0, max_iter=50,
+                backend='serial', patience=2)
+    model.fit(train, validation=validation,
+              callback=lambda info: seen.append(info['iteration']))
+    assert model.n_iter_ < 50
+    assert seen == [info['iteration'] for info in model.history_]
+
+
+def test_fit_holds_the_ratings_once_in_compact_form():
+    ratings = random_ratings().astype(float)
+    model = ALS(3, seed=0, max_iter=3, backend='serial', dtype='float32')
+    model.fit(ratings)
+    assert model.ratings is model.ratings_data.csr
+    assert model.ratings.data.dtype == np.uint8
+    assert model.user_feats.dtype == np.float32
+    n_users = ratings.shape[0]
+    model.add_user(n_users)
+    model.update_user(n_users, 4, 5)
+    model.update_user(0, 4, 2)
+    items, stars = model.user_ratings(n_users)
+    assert list(items) == [4] and list(stars) == [5]
+    model.partial_fit()
+    assert model.ratings.shape == (n_users + 1, ratings.shape[1])
+    assert model.ratings.data.dtype == np.uint8
+    assert len(model.recommend(n_users, k=3)[0]) == 3
@@ -0,0 +1,43 @@
+"""Tests for the CCD++ engine."""
+
+from os import path
+
+import numpy as np
+import pytest
+
+from ccd import CCD
+from test_als import random_ratings
+
+
+def test_fit_supports_the_als_fit_interface():
+    train, validation = random_ratings(), random_ratings(seed=1)
+    seen = []
+    model = CCD(5, lambda_=0.01, seed=0, tolerance=0, max_iter=50,
+                patience=2, rmse_sample=0.5)
+    model.fit(train, validation=validation,
+              callback=lambda info: seen.append(info['iteration']))
+    assert model.n_iter_ < 50
+    assert model.best_iter_ == model.n_iter_ - 2
+    assert seen == [info['iteration'] for info in model.history_]
+    assert set(model.history_[0]['timings']) == {'sweep', 'rmse'}
+
+
+def test_fit_resumes_from_a_checkpoint(tmp_path):
+    ratings = random_ratings()
+    checkpoint = str(tmp_path / 'ccd.npz')
+    full = CCD(4, seed=0, tolerance=0, max_iter=6)
+    full.fit(ratings)
+
+    def interrupt(info):
+        if info['iteration'] == 3:
+            raise KeyboardInterrupt
+
+    model = CCD(4, seed=0, tolerance=0, max_iter=6)
+    with pytest.raises(KeyboardInterrupt):
+        model.fit(ratings, checkpoint=checkpoint, callback=interrupt)
+    assert path.exists(checkpoint)
+    resumed = CCD(4, seed=0, tolerance=0, max_iter=6)
+    resumed.fit(ratings, checkpoint=checkpoint)
+    assert resumed.n_iter_ == 6 and not path.exists(checkpoint)
+    np.testing.assert_allclose(resumed.user_feats, full.user_feats)
+    np.testing.assert_allclose(resumed.item_feats, full.item_feats)
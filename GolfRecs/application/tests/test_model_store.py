@@ -0,0 +1,118 @@
+"""Tests for the on disk model format and the review log."""
+
+import pickle
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from als import ALS
+import model_store
+
+
+def legacy_pickle(file_path, n_users=30, n_items=12, rank=3):
+    """Pickle a model with only the attributes of the original ALS class.
+
+    Unpickling restores an instance's __dict__ without calling __init__, so
+    this is what loading a model.pkl written before model_store gives.
+
+    """
+    rand = np.random.RandomState(0)
+    ratings = csr_matrix(
+        rand.randint(1, 6, (n_users, n_items))
+        * (rand.rand(n_users, n_items) < 0.4)
+    ).astype(float)
+    legacy = ALS.__new__(ALS)
+    legacy.__dict__.update({
+        'rank': rank,
+        'lambda_': 0.1,
+        'tolerance': 0.001,
+        'rand': rand,
+        'ratings': ratings,
+        'item_feats': rand.rand(rank, n_items),
+        'user_feats': rand.rand(rank, n_users)
+    })
+    with open(file_path, 'wb') as model_file:
+        pickle.dump(legacy, model_file)
+    return legacy
+
+
+def test_open_model_migrates_legacy_pickle(tmp_path):
+    legacy = legacy_pickle(str(tmp_path / 'model.pkl'))
+    n_users, n_items = legacy.ratings.shape
+    model_dir = str(tmp_path / 'model')
+    log = model_store.ReviewLog(str(tmp_path / 'model' / 'reviews.log'))
+
+    def prepare(model):
+        model.set_locations(
+            np.arange(n_items),
+            np.linspace(30, 40, n_items),
+            np.linspace(-100, -90, n_items)
+        )
+
+    model = model_store.open_model(
+        model_dir, log, legacy=str(tmp_path / 'model.pkl'), prepare=prepare
+    )
+    np.testing.assert_array_equal(model.user_feats, legacy.user_feats)
+    np.testing.assert_array_equal(model.item_feats, legacy.item_feats)
+    assert model.tiles_ is not None
+    items, _ = model.recommend(0, k=3)
+    assert len(items) == 3
+    model.recommend_local(0, 35, -95, radius_miles=500)
+    model.add_user(n_users)
+    model.update_user(n_users, 1, 4)
+    model_store.save_model(model, model_dir)
+    assert model_store.load_model(model_dir).ratings.shape == \
+        (n_users + 1, n_items)
+
+
+def test_previous_snapshot_stays_loadable(tmp_path):
+    legacy_pickle(str(tmp_path / 'model.pkl'))
+    model_dir = str(tmp_path / 'model')
+    model = model_store.load_legacy(str(tmp_path / 'model.pkl'))
+    model_store.save_model(model, model_dir)
+    header = model_store.read_header(model_dir)
+    user_feats = np.array(model.user_feats)
+    model.user_feats = model.user_feats + 1
+    model_store.save_model(model, model_dir, log_folded=3)
+    old = model_store.load_model(model_dir, header=header, verify=True)
+    np.testing.assert_array_equal(old.user_feats, user_feats)
+    assert model_store.log_folded(model_dir, header) == 0
+    assert model_store.log_folded(model_dir) == 3
+    model_store.save_model(model, model_dir, log_folded=4)
+    n_files = len(list((tmp_path / 'model').glob('*.npy')))
+    assert n_files == 2 * len(model_store.read_header(model_dir)['arrays'])
+
+
+def test_open_model_replays_unfolded_records(tmp_path):
+    legacy = legacy_pickle(str(tmp_path / 'model.pkl'))
+    n_users = legacy.ratings.shape[0]
+    model_dir = str(tmp_path / 'model')
+    log = model_store.ReviewLog(str(tmp_path / 'model' / 'reviews.log'))
+    model_store.open_model(model_dir, log, legacy=str(tmp_path / 'model.pkl'))
+    log.append('add_user', n_users)
+    log.compact(model_dir)
+    log.append('update_user', n_users, 2, 5)
+    model = model_store.open_model(model_dir, log)
+    items, ratings = model.user_ratings(n_users)
+    assert list(items) == [2] and list(ratings) == [5]
+
+
+def test_open_model_survives_concurrent_compaction(tmp_path, monkeypatch):
+    legacy = legacy_pickle(str(tmp_path / 'model.pkl'))
+    n_users = legacy.ratings.shape[0]
+    model_dir = str(tmp_path / 'model')
+    log = model_store.ReviewLog(str(tmp_path / 'model' / 'reviews.log'))
+    model_store.open_model(model_dir, log, legacy=str(tmp_path / 'model.pkl'))
+    log.append('add_user', n_users)
+    log.append('update_user', n_users, 2, 5)
+    load_model = model_store.load_model
+
+    def load_then_compact(*args, **kwargs):
+        model = load_model(*args, **kwargs)
+        log.compact(model_dir)
+        return model
+
+    monkeypatch.setattr(model_store, 'load_model', load_then_compact)
+    model = model_store.open_model(model_dir, log)
+    items, ratings = model.user_ratings(n_users)
+    assert list(items) == [2] and list(ratings) == [5]